@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 
 from mamonsu.plugins.pgsql.plugin import PgsqlPlugin as Plugin
-from mamonsu.plugins.pgsql.pool import Pooler
 
 
 class BiggestTables(Plugin):
@@ -13,9 +12,9 @@ class BiggestTables(Plugin):
 
     def run(self, zbx):
         tables = []
-        for info_dbs in Pooler.query('select datname \
+        for info_dbs in self.pool.query('select datname \
                 from pg_catalog.pg_database where datistemplate = false'):
-            for info_sizes in Pooler.query("select n.nspname, c.relname, \
+            for info_sizes in self.pool.query("select n.nspname, c.relname, \
                     pg_catalog.pg_total_relation_size(c.oid) as size from \
                     pg_catalog.pg_class c left join pg_catalog.pg_namespace n \
                         on n.oid = c.relnamespace \
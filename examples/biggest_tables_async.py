@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+# The same as biggest_tables.py, but databases are queried concurrently
+# from the event loop of scheduler. Python 3.5+ only.
+
+import asyncio
+
+from mamonsu.plugins.pgsql.plugin import PgsqlPlugin as Plugin
+
+
+class BiggestTablesAsync(Plugin):
+
+    # every 5 min
+    Interval = 5 * 60
+    # queries only through self.async_pool, so it is copied
+    # for each [postgres:NAME] instance
+    PerInstance = True
+    # only 10 biggest tables
+    Limit = 10
+
+    async def run(self, zbx):
+        dbs = [row[0] for row in await self.async_pool.query(
+            'select datname from pg_catalog.pg_database \
+            where datistemplate = false')]
+        results = await asyncio.gather(
+            *[self.sizes(db) for db in dbs], return_exceptions=True)
+        tables = []
+        for db, result in zip(dbs, results):
+            if isinstance(result, Exception):
+                self.log.error('Database {0}: {1}'.format(db, result))
+                continue
+            for info_sizes in result:
+                table_name = '{0}.{1}.{2}'.format(
+                    db, info_sizes[0], info_sizes[1])
+                tables.append({'{#TABLE}': table_name})
+                zbx.send('pgsql.table.size[{0}]'.format(
+                    table_name), info_sizes[2])
+        zbx.send('pgsql.table.discovery[]', zbx.json({'data': tables}))
+
+    async def sizes(self, db):
+        return await self.async_pool.query("select n.nspname, c.relname, \
+            pg_catalog.pg_total_relation_size(c.oid) as size from \
+            pg_catalog.pg_class c left join pg_catalog.pg_namespace n \
+                on n.oid = c.relnamespace \
+            where c.relkind IN ('r','v','m','S','f','') \
+            order by size \
+            desc limit {0};".format(self.Limit), db)
+
+    def discovery_rules(self, template):
+        rule = {
+            'name': 'Biggest table discovery',
+            'key': 'pgsql.table.discovery[]',
+            'filter': '{#TABLE}:.*'
+        }
+        items = [
+            {'key': 'pgsql.table.size[{#TABLE}]',
+                'name': 'Table {#TABLE}: size',
+                'units': Plugin.UNITS.bytes,
+                'value_type': Plugin.VALUE_TYPE.numeric_unsigned,
+                'delay': self.Interval}]
+        return template.discovery_rule(rule=rule, items=items)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+# Event loop for plugins with `async def run`, Python 3.5+ only.
+# Such plugins share one thread, so they must not block: use
+# self.async_pool of PgsqlPlugin (AsyncPooler from
+# mamonsu.plugins.pgsql.pool for the main instance) for queries.
+
+import asyncio
+import logging
+import threading
+import traceback
+
+from mamonsu.lib.plugin import PluginDisableException
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+
+class EventLoop(object):
+
+    def __init__(self):
+        self.log = logging.getLogger('EVENTLOOP')
+        self.loop = asyncio.new_event_loop()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name='event-loop')
+        self._thread.daemon = True
+        self._thread.start()
+        self.log.info('started')
+
+    # run coroutine in the loop, return concurrent.futures.Future
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+
+# the same as Scheduler._execute for a coroutine plugin.run
+async def execute(scheduler, job, deadline):
+    plugin, disabled = job.plugin, False
+    started = monotonic()
+    try:
+        await plugin.run(plugin.sender)
+    except PluginDisableException as e:
+        plugin.log.info('disable plugin: {0}.'.format(e))
+        disabled = True
+    except Exception as e:
+        scheduler._failed(job, e, traceback.format_exc())
+    scheduler._finish(job, deadline, started, disabled)
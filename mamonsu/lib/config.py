@@ -31,12 +31,34 @@ class Config(DefaultConfig):
         config.set('postgres', 'port', str(Config.default_port()))
         config.set('postgres', 'application_name', str(Config.default_app()))
         config.set('postgres', 'query_timeout', '10')
+        config.set('postgres', 'pool_min', str(1))
+        config.set('postgres', 'pool_max', str(4))
+        config.set('postgres', 'pool_idle_timeout', str(300))
+        config.set('postgres', 'pool_timeout', str(10))
+        config.set('postgres', 'activity_staleness', str(10))
 
         config.add_section('system')
         config.set('system', 'enabled', str(True))
 
         config.add_section('sender')
         config.set('sender', 'queue', str(300))
+        config.set('sender', 'queue_policy', 'drop-oldest')
+        config.set('sender', 'channel_size', str(10000))
+        config.set('sender', 'channel_policy', 'drop-oldest')
+        config.set('sender', 'channel_timeout', str(1))
+        config.set('sender', 'last_value_ttl', str(60 * 60))
+        config.set('sender', 'spool', str(None))
+        config.set('sender', 'spool_max_size_mb', str(256))
+        config.set('sender', 'spool_max_age', str(24 * 60 * 60))
+        config.set('sender', 'spool_segment_size_mb', str(16))
+
+        config.add_section('scheduler')
+        config.set('scheduler', 'workers', str(8))
+        config.set('scheduler', 'group_workers', str(4))
+        config.set('scheduler', 'align', str(False))
+        config.set('scheduler', 'spread', str(0))
+        config.set('scheduler', 'overrun', 'skip')
+        config.set('scheduler', 'backoff_max', str(8))
 
         config.add_section('agent')
         config.set('agent', 'enabled', str(True))
@@ -52,6 +74,11 @@ class Config(DefaultConfig):
         config.set('zabbix', 'client', socket.gethostname())
         config.set('zabbix', 'address', '127.0.0.1')
         config.set('zabbix', 'port', str(10051))
+        config.set('zabbix', 'timeout', str(15))
+        config.set('zabbix', 'keepalive', str(True))
+        config.set('zabbix', 'compression', str(False))
+        config.set('zabbix', 'batch_size', str(1000))
+        config.set('zabbix', 'batch_bytes', str(1024 * 1024))
 
         config.add_section('metric_log')
         config.set('metric_log', 'enabled', str(False))
@@ -105,6 +132,53 @@ class Config(DefaultConfig):
         except KeyError:
             return None
 
+    # additional PostgreSQL instances from sections [postgres:NAME]:
+    # [(name, connection info, zabbix host)], options which are not
+    # set are taken from [postgres]
+    def instances(self):
+        result = []
+        for section in self.config.sections():
+            if not section.startswith('postgres:'):
+                continue
+            name = section[len('postgres:'):]
+            if self.config.has_option(section, 'enabled') and \
+                    not self.fetch(section, 'enabled', bool):
+                continue
+
+            def option(key, klass=None):
+                if self.config.has_option(section, key):
+                    return self.fetch(section, key, klass)
+                return self.fetch('postgres', key, klass)
+
+            # auto host of [postgres] is resolved for port of instance
+            host = self._host
+            if self.config.has_option(section, 'host'):
+                host = self.fetch(section, 'host')
+            port = option('port', int)
+            if host == 'auto' and platform.UNIX:
+                host = self._auto_host(
+                    port, option('database'), option('user'),
+                    option('password'))
+            info = {
+                'name': section,
+                'host': host,
+                'port': port,
+                'user': option('user'),
+                'passwd': option('password'),
+                'db': option('database'),
+                'timeout': option('query_timeout', int),
+                'appname': option('application_name'),
+                'pool_min': option('pool_min', int),
+                'pool_max': option('pool_max', int),
+                'pool_idle': option('pool_idle_timeout', int),
+                'pool_timeout': option('pool_timeout', int),
+                'activity_staleness': option('activity_staleness', int)}
+            client = name
+            if self.config.has_option(section, 'client'):
+                client = self.fetch(section, 'client')
+            result.append((name, info, client))
+        return result
+
     def _apply_environ(self):
         os.environ['PGUSER'] = self.fetch('postgres', 'user')
         if self.fetch('postgres', 'password'):
@@ -114,6 +188,12 @@ class Config(DefaultConfig):
         os.environ['PGDATABASE'] = self.fetch('postgres', 'database')
         os.environ['PGTIMEOUT'] = self.fetch('postgres', 'query_timeout')
         os.environ['PGAPPNAME'] = self.fetch('postgres', 'application_name')
+        os.environ['PGPOOLMIN'] = self.fetch('postgres', 'pool_min')
+        os.environ['PGPOOLMAX'] = self.fetch('postgres', 'pool_max')
+        os.environ['PGPOOLIDLE'] = self.fetch('postgres', 'pool_idle_timeout')
+        os.environ['PGPOOLTIMEOUT'] = self.fetch('postgres', 'pool_timeout')
+        os.environ['PGACTIVITYSTALENESS'] = self.fetch(
+            'postgres', 'activity_staleness')
 
     def _apply_log_setting(self):
         logging.basicConfig(
@@ -148,32 +228,29 @@ class Config(DefaultConfig):
         self._override_auto_host()
 
     def _override_auto_host(self):
+        # not resolved value is used by instances of [postgres:NAME]
+        self._host = self.fetch('postgres', 'host')
+        if self._host == 'auto' and platform.UNIX:
+            self.config.set('postgres', 'host', self._auto_host(
+                self.fetch('postgres', 'port'),
+                self.fetch('postgres', 'database'),
+                self.fetch('postgres', 'user'),
+                self.fetch('postgres', 'password')))
+            self._apply_environ()
 
-        def test_db(self, host_pre):
+    # the first of unix sockets and 127.0.0.1 which accepts connections
+    def _auto_host(self, port, db, user, password):
+        logging.debug('Host set to auto, test variables')
+        for host in [
+                '/tmp/.s.PGSQL.{0}'.format(port),
+                '/var/run/postgresql/.s.PGSQL.{0}'.format(port),
+                '127.0.0.1']:
             if is_conn_to_db(
-                host=host_pre,
-                db=self.fetch('postgres', 'database'),
-                port=str(self.fetch('postgres', 'port')),
-                user=self.fetch('postgres', 'user'),
-                    paswd=self.fetch('postgres', 'password')):
-                self.config.set('postgres', 'host', host_pre)
-                self._apply_environ()
-                return True
-            return False
-
-        host = self.fetch('postgres', 'host')
-        port = str(self.fetch('postgres', 'port'))
-        if host == 'auto' and platform.UNIX:
-            logging.debug('Host set to auto, test variables')
-            if test_db(self, '/tmp/.s.PGSQL.{0}'.format(port)):
-                return
-            if test_db(self, '/var/run/postgresql/.s.PGSQL.{0}'.format(port)):
-                return
-            if test_db(self, '127.0.0.1'):
-                return
-            #  не выходим, так как ожидаем коннекта до localhost
-            self.config.set('postgres', 'host', 'localhost')
-            self._apply_environ()
+                    host=host, db=db, port=str(port),
+                    user=user, paswd=password):
+                return host
+        #  не выходим, так как ожидаем коннекта до localhost
+        return 'localhost'
 
     def _apply_default_config(self):
         for plugin in Plugin.only_child_subclasses():
@@ -44,6 +44,7 @@ class _api(object):
 
     METRIC_LIST_URLS = ['/list', '/list/']
     METRIC_GET_URLS = ['/get', '/get/']
+    QUERY_STATS_URLS = ['/queries', '/queries/']
 
 
 Template = _template()
@@ -48,6 +48,7 @@ Examples:
     {prog} agent version
     {prog} agent metric-list
     {prog} agent metric-get <metric key>
+    {prog} agent queries
 
 
 Zabbix API toolbox:
@@ -12,3 +12,6 @@ if PY2:
     INTEGER_TYPES = (int, long)
 if PY3:
     INTEGER_TYPES = int,
+
+# async def plugins, see lib/aio.py
+ASYNC = (sys.version_info >= (3, 5))
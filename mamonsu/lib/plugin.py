@@ -26,6 +26,11 @@ class Plugin(object):
     _thread = None  # type: Thread
     _sender = False
     _enabled = True
+    # run in own thread instead of shared scheduler,
+    # for plugins with blocking run (http server and etc)
+    _detached = False
+    # name of PostgreSQL instance from [postgres:NAME], None for main
+    instance = None
 
     # for all childs
     is_child = True
@@ -104,6 +109,14 @@ class Plugin(object):
     def is_sender(self):
         return self._sender
 
+    def is_detached(self):
+        return self._detached
+
+    # plugins of one group share limited count of scheduler workers,
+    # None: not limited
+    def worker_group(self):
+        return None
+
     def is_enabled(self):
         if self.plugin_config('enabled') == 'False':
             return False
@@ -112,6 +125,11 @@ class Plugin(object):
     def disable(self):
         self._enabled = False
 
+    # senders: receive list of (key, value, host, clock)
+    def send_many(self, metrics):
+        for metric in metrics:
+            self.send(*metric)
+
     def set_sender(self, sender):
         self.sender = sender
 
@@ -146,10 +164,10 @@ class Plugin(object):
                 trace = traceback.format_exc()
                 self._log_exception(e, trace)
                 return
-            sleep_time = self.Interval - int(time.time() - last_start)
+            sleep_time = self.Interval - (time.time() - last_start)
             if sleep_time > 0:
                 time.sleep(sleep_time)
             else:
                 self.log.error(
-                    'Timeout: {0}s'.format(int(time.time() - last_start)))
+                    'Timeout: {0:.1f}s'.format(time.time() - last_start))
                 return
@@ -1,34 +1,68 @@
 # -*- coding: utf-8 -*-
 
+import random
 import threading
 
 
 class Queue(object):
 
-    def __init__(self):
+    # what to do with a new metric when queue is full:
+    #   drop-oldest - evict the oldest metric
+    #   drop-newest - discard the new metric
+    #   sample - keep uniform random sample of all metrics
+    #            added since last flush (reservoir sampling)
+    Policies = ['drop-oldest', 'drop-newest', 'sample']
+
+    def __init__(self, limit=None, policy='drop-oldest'):
+        if policy not in self.Policies:
+            raise ValueError('Unknown queue policy: {0}'.format(policy))
+        # ring buffer: list grows up to limit, then the oldest
+        # metric is at `head` and is overwritten by drop-oldest
         self.queue = []
+        self.head = 0
         self.lock = threading.Lock()
+        self.limit = limit
+        self.policy = policy
+        # metrics dropped since start
+        self.dropped = 0
+        # metrics added since last flush, for sample policy
+        self._seen = 0
 
+    # return count of dropped metrics: 0 or 1
     def add(self, metric):
-        self.lock.acquire()
-        self.queue.insert(0, metric)
-        self.lock.release()
+        with self.lock:
+            return self._add(metric)
+
+    # add list of metrics, return count of dropped metrics
+    def add_many(self, metrics):
+        dropped = 0
+        with self.lock:
+            for metric in metrics:
+                dropped += self._add(metric)
+        return dropped
 
-    # replace last metric
-    def replace(self, metric):
-        self.lock.acquire()
-        self.queue.pop()
-        self.queue.append(metric)
-        self.lock.release()
+    def _add(self, metric):
+        self._seen += 1
+        if self.limit is None or len(self.queue) < self.limit:
+            self.queue.append(metric)
+            return 0
+        self.dropped += 1
+        if self.policy == 'drop-oldest':
+            self.queue[self.head] = metric
+            self.head = (self.head + 1) % self.limit
+        elif self.policy == 'sample':
+            idx = random.randrange(self._seen)
+            if idx < len(self.queue):
+                self.queue[idx] = metric
+        return 1
 
     def size(self):
-        self.lock.acquire()
-        result = len(self.queue)
-        self.lock.release()
-        return result
+        with self.lock:
+            return len(self.queue)
 
+    # return all metrics, the oldest first
     def flush(self):
-        self.lock.acquire()
-        result, self.queue = self.queue, []
-        self.lock.release()
+        with self.lock:
+            result = self.queue[self.head:] + self.queue[:self.head]
+            self.queue, self.head, self._seen = [], 0, 0
         return result
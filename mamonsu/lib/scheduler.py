@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+
+import time
+import zlib
+import heapq
+import inspect
+import logging
+import threading
+import traceback
+
+import mamonsu.lib.platform as platform
+from mamonsu.lib.plugin import PluginDisableException
+from mamonsu.lib.workers import WorkerPool
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+
+class Job(object):
+
+    # run duration histogram: (upper bound in seconds, name)
+    Buckets = [
+        (0.1, '100ms'), (1, '1s'), (10, '10s'),
+        (60, '1m'), (300, '5m'), (None, 'inf')]
+
+    def __init__(self, plugin, overrun):
+        self.plugin = plugin
+        self.name = plugin.__class__.__name__.lower()
+        if plugin.instance is not None:
+            self.name += ':{0}'.format(plugin.instance)
+        self.overrun = overrun
+        # `async def run` is executed in the event loop, not in a worker
+        self.coroutine = platform.ASYNC and \
+            inspect.iscoroutinefunction(plugin.run)
+        # limited groups of shared workers: plugin class and
+        # group of plugin (PostgreSQL instance)
+        self.groups = [plugin.__class__.__name__.lower()]
+        if plugin.worker_group() is not None:
+            self.groups.append(plugin.worker_group())
+        # senders run in own thread, set by scheduler
+        self.workers = None
+        self.deadline = None
+        # Interval multiplier for backoff policy
+        self.factor = 1
+        # deadline to return after coalesced run
+        self.resume = None
+        # counters since start
+        self.runs, self.errors, self.missed, self.overruns = 0, 0, 0, 0
+        self.histogram = [0] * len(self.Buckets)
+        # maximums since last take_stats()
+        self.max_skew, self.max_duration = 0, 0
+
+    def interval(self):
+        return self.plugin.Interval * self.factor
+
+    def record(self, skew, duration):
+        self.runs += 1
+        self.max_skew = max(self.max_skew, skew)
+        self.max_duration = max(self.max_duration, duration)
+        for idx, bucket in enumerate(self.Buckets):
+            if bucket[0] is None or duration <= bucket[0]:
+                self.histogram[idx] += 1
+                break
+
+    def take_stats(self):
+        result = {
+            'skew': self.max_skew,
+            'duration': self.max_duration,
+            'runs': self.runs,
+            'errors': self.errors,
+            'missed': self.missed,
+            'overruns': self.overruns,
+            'interval': self.interval(),
+            'histogram': [
+                (bucket[1], self.histogram[idx])
+                for idx, bucket in enumerate(self.Buckets)]}
+        self.max_skew, self.max_duration = 0, 0
+        return result
+
+
+class Scheduler(object):
+
+    Running = True
+
+    # what to do with a plugin which run is longer than its Interval:
+    #   skip - drop missed runs, wait for the next scheduled one
+    #   coalesce - run once right now for all missed runs,
+    #              then return to the schedule
+    #   late - run right now and continue the schedule from this run
+    #   backoff - double plugin Interval while runs do not fit in it
+    #             (up to backoff_max times), halve it back when they do
+    OverrunPolicies = ['skip', 'coalesce', 'late', 'backoff']
+
+    def __init__(self, config):
+        self.log = logging.getLogger('SCHEDULER')
+        self.workers = WorkerPool(
+            config.fetch('scheduler', 'workers', int), 'scheduler')
+        # workers one group can hold, so that a hung PostgreSQL
+        # does not stop other plugins, at least one worker is left
+        self.group_workers = max(1, min(
+            config.fetch('scheduler', 'group_workers', int),
+            self.workers.size - 1))
+        # align runs to wall-clock multiples of Interval
+        self.align = config.fetch('scheduler', 'align', bool)
+        # spread plugins with same Interval over this count of seconds
+        self.spread = config.fetch('scheduler', 'spread', float)
+        self.overrun = config.fetch('scheduler', 'overrun')
+        self.backoff_max = config.fetch('scheduler', 'backoff_max', int)
+        self.jobs = []
+        self._heap, self._seq = [], 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._event_loop = None
+        # {group: running jobs}, [(job, deadline)] over group limit
+        self._running, self._waiting = {}, []
+        self._errors, self._last_error = 0, ''
+
+    def add(self, plugin):
+        # policy can be overridden in plugin section
+        overrun = plugin.plugin_config('overrun') or self.overrun
+        if overrun not in self.OverrunPolicies:
+            plugin.log.error(
+                'Unknown overrun policy: {0}, use skip'.format(overrun))
+            overrun = 'skip'
+        job = Job(plugin, overrun)
+        if plugin.is_sender():
+            # flush must not wait for workers hung on PostgreSQL
+            job.workers = WorkerPool(1, 'sender-{0}'.format(job.name))
+        if job.coroutine and self._event_loop is None:
+            from mamonsu.lib.aio import EventLoop
+            self._event_loop = EventLoop()
+        self.jobs.append(job)
+        self._schedule(job, self._first_deadline(job, monotonic()))
+
+    def start(self):
+        if self._event_loop is not None:
+            self._event_loop.start()
+        self._thread = threading.Thread(target=self._loop, name='scheduler')
+        self._thread.daemon = True
+        self._thread.start()
+        self.log.info('started with {0} plugins, {1} workers'.format(
+            len(self.jobs), self.workers.size))
+
+    def is_alive(self):
+        if self._thread is not None:
+            return self._thread.is_alive()
+        return False
+
+    # errors since last call: (count, last error text)
+    def take_errors(self):
+        with self._cond:
+            result = (self._errors, self._last_error)
+            self._errors, self._last_error = 0, ''
+        return result
+
+    # per job stats since last call: [(job name, stats)]
+    def take_stats(self):
+        with self._cond:
+            return [(job.name, job.take_stats()) for job in self.jobs]
+
+    def _schedule(self, job, deadline):
+        with self._cond:
+            job.deadline = deadline
+            self._seq += 1
+            heapq.heappush(self._heap, (deadline, self._seq, job))
+            self._cond.notify()
+
+    def _loop(self):
+        while self.Running:
+            with self._cond:
+                while True:
+                    now = monotonic()
+                    if len(self._heap) > 0 and self._heap[0][0] <= now:
+                        break
+                    timeout = None
+                    if len(self._heap) > 0:
+                        timeout = self._heap[0][0] - now
+                    self._cond.wait(timeout)
+                deadline, _, job = heapq.heappop(self._heap)
+            if job.coroutine:
+                from mamonsu.lib.aio import execute
+                self._event_loop.submit(execute(self, job, deadline))
+            elif job.workers is not None:
+                job.workers.submit(self._execute, job, deadline)
+            else:
+                with self._cond:
+                    if not self._acquire(job):
+                        self._waiting.append((job, deadline))
+                        continue
+                self.workers.submit(self._execute, job, deadline)
+
+    # take worker for job if its groups are under limit
+    def _acquire(self, job):
+        for group in job.groups:
+            if self._running.get(group, 0) >= self.group_workers:
+                return False
+        for group in job.groups:
+            self._running[group] = self._running.get(group, 0) + 1
+        return True
+
+    # free worker of job, start waiting jobs which fit now
+    def _release(self, job):
+        ready = []
+        with self._cond:
+            for group in job.groups:
+                self._running[group] -= 1
+            for item in list(self._waiting):
+                if self._acquire(item[0]):
+                    self._waiting.remove(item)
+                    ready.append(item)
+        for waiting, deadline in ready:
+            self.workers.submit(self._execute, waiting, deadline)
+
+    def _execute(self, job, deadline):
+        plugin, disabled = job.plugin, False
+        started = monotonic()
+        try:
+            plugin.run(plugin.sender)
+        except PluginDisableException as e:
+            plugin.log.info('disable plugin: {0}.'.format(e))
+            disabled = True
+        except Exception as e:
+            self._failed(job, e, traceback.format_exc())
+        if job.workers is None:
+            self._release(job)
+        self._finish(job, deadline, started, disabled)
+
+    def _failed(self, job, e, trace):
+        job.plugin._log_exception(e, trace)
+        with self._cond:
+            job.errors += 1
+            self._errors += 1
+            self._last_error = job.plugin.last_error_text
+
+    # record run and schedule the next one
+    def _finish(self, job, deadline, started, disabled):
+        finished = monotonic()
+        with self._cond:
+            job.record(started - deadline, finished - started)
+        if disabled and not job.plugin.is_enabled():
+            return
+        self._schedule(
+            job, self._next_deadline(job, deadline, started, finished))
+
+    # constant per plugin offset in [0, min(spread, Interval))
+    def _phase(self, job):
+        if not self.spread > 0:
+            return 0
+        spread = min(self.spread, job.plugin.Interval)
+        crc = zlib.crc32(job.name.encode('utf-8')) & 0xffffffff
+        return (crc % 1000) * spread / 1000.0
+
+    def _first_deadline(self, job, now):
+        if not self.align:
+            return now + self._phase(job)
+        return self._align(job, now, now, job.interval())
+
+    # first wall-clock boundary (interval * N + phase) not before `after`,
+    # returned as monotonic time
+    def _align(self, job, after, now, interval):
+        wall = after + (time.time() - now) - self._phase(job)
+        boundary = -(-wall // interval) * interval
+        return after + (boundary - wall)
+
+    # first scheduled run after `now`
+    def _upcoming(self, job, deadline, now, interval):
+        if self.align:
+            return self._align(job, now, now, interval)
+        return deadline + interval * (int((now - deadline) // interval) + 1)
+
+    def _next_deadline(self, job, deadline, started, now):
+        interval = job.interval()
+        if job.resume is not None:
+            # coalesced run is done, back to the schedule
+            deadline, job.resume = job.resume - interval, None
+        overrun = deadline + interval <= now
+        if job.overrun == 'backoff':
+            self._backoff(job, overrun, now - started)
+            interval = job.interval()
+        if not overrun:
+            if self.align:
+                # correct drift between monotonic and wall clock
+                return self._align(
+                    job, deadline + interval / 2.0, now, interval)
+            return deadline + interval
+
+        missed = int((now - deadline) // job.plugin.Interval)
+        if job.overrun in ('coalesce', 'late'):
+            missed -= 1
+        with self._cond:
+            job.overruns += 1
+            job.missed += missed
+        job.plugin.log.error(
+            'Timeout: {0:.1f}s, skipped {1} run(s), policy: {2}'.format(
+                now - deadline, missed, job.overrun))
+        if job.overrun == 'late':
+            return now
+        if job.overrun == 'coalesce':
+            job.resume = self._upcoming(job, deadline, now, interval)
+            return now
+        return self._upcoming(job, deadline, now, interval)
+
+    def _backoff(self, job, overrun, duration):
+        factor = job.factor
+        if overrun:
+            factor = min(factor * 2, self.backoff_max)
+        elif factor > 1 and duration < job.plugin.Interval * factor / 2:
+            factor = factor // 2
+        if factor != job.factor:
+            job.plugin.log.info(
+                'Change interval from {0}s to {1}s'.format(
+                    job.interval(), job.plugin.Interval * factor))
+            job.factor = factor
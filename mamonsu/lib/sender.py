@@ -1,29 +1,180 @@
 # -*- coding: utf-8 -*-
 import json
 import time
+import logging
+import threading
+import traceback
 
 from mamonsu.lib.plugin import Plugin
+from mamonsu.lib.queue import Queue
 import mamonsu.lib.platform as platform
 
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+if platform.PY3:
+    from sys import intern
+
+
+# keys repeat on every run, keep one copy of each
+def _intern(key):
+    if isinstance(key, str):
+        return intern(key)
+    return key
+
+
+class Channel(object):
+
+    # backpressure policy when channel is full: queue policies
+    # or block - wait up to `timeout` seconds for free space,
+    #            then drop the new metrics
+    Policies = Queue.Policies + ['block']
+
+    def __init__(self, sender, size, policy, timeout):
+        self.sender = sender
+        self.name = sender.__class__.__name__.lower()
+        self.log = logging.getLogger('CHANNEL-{0}'.format(self.name))
+        self.policy = policy
+        self.timeout = timeout
+        # metrics (key, value, host, clock), limit is count of metrics,
+        # not of batches, which could be of thousands of metrics
+        self.queue = Queue(
+            size, 'drop-newest' if policy == 'block' else policy)
+        # time of put of the oldest metric in queue
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._thread = None
+        self._full = False
+        # delivered metrics since start, max latency since last take_stats()
+        self.delivered, self.max_latency = 0, 0
+
+    def put(self, metrics):
+        now = monotonic()
+        with self._cond:
+            if self.policy == 'block':
+                deadline = now + self.timeout
+                # batch bigger than channel waits only for empty one
+                while self.queue.size() > 0 and self.queue.size() + \
+                        len(metrics) > self.queue.limit:
+                    timeout = deadline - monotonic()
+                    if timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+            if self._oldest is None:
+                self._oldest = now
+            # log once until the channel is drained
+            if self.queue.add_many(metrics) > 0 and not self._full:
+                self._full = True
+                self.log.error('Channel is full, drop metrics ({0})'.format(
+                    self.policy))
+            self._cond.notify_all()
+        if self._thread is None:
+            self._start()
+
+    def take_stats(self):
+        with self._cond:
+            result = {
+                'latency': self.max_latency,
+                'backlog': self.queue.size(),
+                'delivered': self.delivered,
+                'dropped': self.queue.dropped}
+            self.max_latency = 0
+        return result
+
+    def _start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._loop, name='channel-{0}'.format(self.name))
+            self._thread.daemon = True
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self.queue.size() == 0:
+                    self._cond.wait()
+                metrics, put_time = self.queue.flush(), self._oldest
+                self._oldest, self._full = None, False
+                self._cond.notify_all()
+            self._deliver(metrics)
+            latency = monotonic() - put_time
+            with self._cond:
+                self.delivered += len(metrics)
+                self.max_latency = max(self.max_latency, latency)
+
+    def _deliver(self, metrics):
+        try:
+            if len(metrics) == 1:
+                self.sender.send(*metrics[0])
+            else:
+                self.sender.send_many(metrics)
+        except Exception as e:
+            self.sender._log_exception(e, traceback.format_exc())
+
+
+class LastValue(object):
+
+    __slots__ = ('value', 'clock')
+
+    def __init__(self, value, clock):
+        self.value, self.clock = value, clock
+
 
 class Sender():
 
-    def __init__(self):
+    # seconds to keep last value of metric which is not sent anymore
+    LastValueTTL = 3600
+
+    def __init__(self, config=None):
         self._senders = []
+        self._channels = {}
+        # last values: {host: {key: LastValue}}
         self._last_values = {}
+        self._lock = threading.Lock()
+        self.config = config
+        self.last_value_ttl = self.LastValueTTL
+        if config is not None:
+            self.last_value_ttl = config.fetch(
+                'sender', 'last_value_ttl', int)
+        self._evicted = time.time()
 
-    def _hash(self, key, host=None):
-        return '{0}_+_{1}'.format(host, key)
-
-    def _key_from_hash(self, hash, host=None):
-        result = hash.split('{0}_+_'.format(host))
-        if len(result) == 1:
-            return hash
-        else:
-            return result[1]
-
+    # without config metrics are passed to senders in the caller thread,
+    # else each sender gets own channel and thread
     def add_sender(self, sender):
         self._senders.append(sender)
+        if self.config is None:
+            return
+        policy = sender.plugin_config('channel_policy') or \
+            self.config.fetch('sender', 'channel_policy')
+        if policy not in Channel.Policies:
+            sender.log.error(
+                'Unknown channel policy: {0}, use drop-oldest'.format(policy))
+            policy = 'drop-oldest'
+        self._channels[sender] = Channel(
+            sender,
+            int(sender.plugin_config('channel_size') or
+                self.config.fetch('sender', 'channel_size', int)),
+            policy,
+            float(sender.plugin_config('channel_timeout') or
+                  self.config.fetch('sender', 'channel_timeout', float)))
+
+    # per channel stats since last call: [(sender name, stats)]
+    def take_stats(self):
+        return [
+            (channel.name, channel.take_stats())
+            for channel in self._channels.values()]
+
+    def _deliver(self, sender, metrics):
+        if sender in self._channels:
+            self._channels[sender].put(metrics)
+        elif len(metrics) == 1:
+            sender.send(*metrics[0])
+        else:
+            sender.send_many(metrics)
 
     # resend all values to senders
     def send(self, key, value, delta=None, host=None, clock=None, only_positive_speed=False):
@@ -31,45 +182,126 @@ class Sender():
         if clock is None:
             clock = int(time.time())
 
-        hash_key = self._hash(key, host)
-        if delta is not None:
-            if isinstance(value, float) or isinstance(value, platform.INTEGER_TYPES):
-                if hash_key in self._last_values:
-                    if only_positive_speed and (self._last_values[hash_key][0] > value):
-                            self._last_values[hash_key] = (value, clock)
-                            return
-                    last_value, last_time = self._last_values[hash_key]
-                    self._last_values[hash_key] = (value, clock)
-                    if delta == Plugin.DELTA.speed_per_second:
-                        value = float(value - last_value) / (clock - last_time)
-                    if delta == Plugin.DELTA.simple_change:
-                        value = float(value - last_value)
-                else:
-                    self._last_values[hash_key] = (value, clock)
-                    return
-        else:
-            self._last_values[hash_key] = (value, clock)
+        value = self._value(
+            key, host, value, delta, clock, only_positive_speed)
+        if value is None:
+            return
+
+        for sender in self._senders:
+            if sender.is_enabled():
+                self._deliver(sender, [(key, value, host, clock)])
+
+    # resend list of values to senders at once,
+    # metrics: [(key, value)] or [(key, value, delta)]
+    def send_many(self, metrics, host=None, clock=None, only_positive_speed=False):
+
+        if clock is None:
+            clock = int(time.time())
+
+        result = []
+        for metric in metrics:
+            key, value = metric[0], metric[1]
+            delta = metric[2] if len(metric) > 2 else None
+            value = self._value(
+                key, host, value, delta, clock, only_positive_speed)
+            if value is not None:
+                result.append((key, value, host, clock))
+        if len(result) == 0:
+            return
 
         for sender in self._senders:
             if sender.is_enabled():
-                sender.send(key, value, host, clock)
+                self._deliver(sender, result)
+
+    # remember value and calculate delta, None if nothing to send
+    def _value(self, key, host, value, delta, clock, only_positive_speed):
+        with self._lock:
+            if clock - self._evicted > self.last_value_ttl / 10.0:
+                self._evict(clock)
+            values = self._last_values.get(host)
+            if values is None:
+                values = self._last_values.setdefault(host, {})
+            last = values.get(key)
+            if delta is not None:
+                if not (isinstance(value, float) or
+                        isinstance(value, platform.INTEGER_TYPES)):
+                    return value
+                if last is None:
+                    values[_intern(key)] = LastValue(value, clock)
+                    return None
+                last_value, last_time = last.value, last.clock
+                last.value, last.clock = value, clock
+                if only_positive_speed and last_value > value:
+                    return None
+                if delta == Plugin.DELTA.speed_per_second:
+                    value = float(value - last_value) / (clock - last_time)
+                if delta == Plugin.DELTA.simple_change:
+                    value = float(value - last_value)
+            elif last is None:
+                values[_intern(key)] = LastValue(value, clock)
+            else:
+                last.value, last.clock = value, clock
+        return value
+
+    # forget metrics which were not sent during last_value_ttl
+    def _evict(self, now):
+        deadline, evicted = now - self.last_value_ttl, 0
+        for host in list(self._last_values):
+            values = self._last_values[host]
+            for key in [k for k, v in values.items() if v.clock < deadline]:
+                del values[key]
+                evicted += 1
+            if len(values) == 0:
+                del self._last_values[host]
+        self._evicted = now
+        return evicted
 
     # get last value: (value, clock)
     def get_metric(self, key, host=None):
-        hash_key = self._hash(key, host)
-        if hash_key in self._last_values:
-            return self._last_values[hash_key]
-        else:
-            return (None, None)
+        with self._lock:
+            last = self._last_values.get(host, {}).get(key)
+            if last is None:
+                return (None, None)
+            return (last.value, last.clock)
 
-    # list of metrics: [(key, (value, clock))]
+    # list of metrics of all hosts: [(key, (value, clock))],
+    # keys of other hosts than given are tagged as '<host>_+_<key>'
     def list_metrics(self, host=None):
-        hash_list, result = self._last_values.keys(), []
-        for h in hash_list:
-            result.append(
-                (self._key_from_hash(h, host), self._last_values[h])
-            )
+        result = []
+        with self._lock:
+            for metrics_host, values in self._last_values.items():
+                for key, last in values.items():
+                    if metrics_host != host:
+                        key = '{0}_+_{1}'.format(metrics_host, key)
+                    result.append((key, (last.value, last.clock)))
         return result
 
     def json(self, val):
         return json.dumps(val)
+
+
+class HostSender(object):
+
+    """Sender for plugins of additional PostgreSQL instance:
+    metrics without host are sent for zabbix host of the instance."""
+
+    def __init__(self, sender, host):
+        self.sender = sender
+        self.host = host
+
+    def send(self, key, value, delta=None, host=None, clock=None, only_positive_speed=False):
+        self.sender.send(
+            key, value, delta, host or self.host, clock, only_positive_speed)
+
+    def send_many(self, metrics, host=None, clock=None, only_positive_speed=False):
+        self.sender.send_many(
+            metrics, host or self.host, clock, only_positive_speed)
+
+    def get_metric(self, key, host=None):
+        return self.sender.get_metric(key, host or self.host)
+
+    def list_metrics(self, host=None):
+        return self.sender.list_metrics(host or self.host)
+
+    def __getattr__(self, name):
+        return getattr(self.sender, name)
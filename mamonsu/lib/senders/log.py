@@ -18,8 +18,13 @@ class LogSender(Plugin):
         elif not self.config.fetch('metric_log', 'enabled', bool):
             self._enabled = False
         self._metric_log_fds = {}
-        self.queue = Queue()
         self.max_queue_size = config.fetch('sender', 'queue', int)
+        policy = config.fetch('sender', 'queue_policy')
+        if policy not in Queue.Policies:
+            self.log.error(
+                'Unknown queue policy: {0}, use drop-oldest'.format(policy))
+            policy = 'drop-oldest'
+        self.queue = Queue(self.max_queue_size, policy)
         self.max_size = config.fetch('metric_log', 'max_size_mb', int)
         self.max_size = self.max_size * 1024 * 1024
         self._check_size_counter = 0
@@ -29,11 +34,16 @@ class LogSender(Plugin):
 
     def send(self, key, value, host=None, clock=None):
         metric = (key, value, host, clock)
-        if self.queue.size() > self.max_queue_size:
-            self.log.error('Queue size over limit, replace last metrics')
-            self.queue.replace(metric)
-        else:
-            self.queue.add(metric)
+        if self.queue.add(metric) > 0:
+            self.log.error('Queue size over limit, drop metric ({0})'.format(
+                self.queue.policy))
+
+    def send_many(self, metrics):
+        dropped = self.queue.add_many(metrics)
+        if dropped > 0:
+            self.log.error(
+                'Queue size over limit, drop {0} metrics ({1})'.format(
+                    dropped, self.queue.policy))
 
     def _flush(self):
         metrics = self.queue.flush()
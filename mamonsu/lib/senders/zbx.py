@@ -3,6 +3,8 @@
 # https://www.zabbix.com/documentation/2.0/ru/manual/appendix/items/activepassive
 
 import time
+import zlib
+import errno
 import struct
 import socket
 import json
@@ -12,6 +14,7 @@ import encodings.idna
 import mamonsu.lib.platform as platform
 from mamonsu.lib.plugin import Plugin
 from mamonsu.lib.queue import Queue
+from mamonsu.lib.spool import Spool
 
 
 class ZbxSender(Plugin):
@@ -19,6 +22,11 @@ class ZbxSender(Plugin):
     Interval = 2
     _sender = True
 
+    # spooled batches sent per run, rest is left for the next runs
+    DrainBatches = 10
+    # report spool backlog every StatsInterval seconds
+    StatsInterval = 60
+
     def __init__(self, config):
         super(ZbxSender, self).__init__(config)
         self.host = config.fetch('zabbix', 'address')
@@ -27,11 +35,31 @@ class ZbxSender(Plugin):
         elif not config.fetch('zabbix', 'enabled', bool):
             self._enabled = False
         self.port = config.fetch('zabbix', 'port', int)
+        self.timeout = config.fetch('zabbix', 'timeout', int)
+        self.keepalive = config.fetch('zabbix', 'keepalive', bool)
+        self.compression = config.fetch('zabbix', 'compression', bool)
+        self.batch_size = config.fetch('zabbix', 'batch_size', int)
+        self.batch_bytes = config.fetch('zabbix', 'batch_bytes', int)
         self.max_queue_size = config.fetch('sender', 'queue', int)
         self.fqdn = config.fetch('zabbix', 'client')
-        self.queue = Queue()
+        self._sock = None
         self.log = logging.getLogger(
             'ZBX-{0}:{1}'.format(self.host, self.port))
+        policy = config.fetch('sender', 'queue_policy')
+        if policy not in Queue.Policies:
+            self.log.error(
+                'Unknown queue policy: {0}, use drop-oldest'.format(policy))
+            policy = 'drop-oldest'
+        self.queue = Queue(self.max_queue_size, policy)
+        self.spool = None
+        self._last_stats = 0
+        if self._enabled and config.fetch('sender', 'spool') is not None:
+            self.spool = Spool(
+                config.fetch('sender', 'spool'),
+                config.fetch('sender', 'spool_max_size_mb', int) * 1024 * 1024,
+                config.fetch('sender', 'spool_max_age', int),
+                config.fetch(
+                    'sender', 'spool_segment_size_mb', int) * 1024 * 1024)
 
     def send(self, key, value, host=None, clock=None):
         if host is None:
@@ -43,50 +71,206 @@ class ZbxSender(Plugin):
             'value': str(value), 'clock': clock}
         self._send(metric)
 
+    def send_many(self, metrics):
+        batch = []
+        for key, value, host, clock in metrics:
+            if host is None:
+                host = self.fqdn
+            if clock is None:
+                clock = int(time.time())
+            batch.append({
+                'host': host, 'key': key,
+                'value': str(value), 'clock': clock})
+        if self.spool is not None and \
+                self.queue.size() + len(batch) > self.max_queue_size:
+            self._spill(self.queue.flush() + batch)
+            return
+        dropped = self.queue.add_many(batch)
+        if dropped > 0:
+            self.log.error(
+                'Queue size over limit, drop {0} metrics ({1})'.format(
+                    dropped, self.queue.policy))
+
     def _send(self, metric):
-        if self.queue.size() > self.max_queue_size:
-            self.log.error('Queue size over limit, replace last metric')
-            self.queue.replace(metric)
-        else:
-            self.queue.add(metric)
+        if self.spool is not None and \
+                self.queue.size() >= self.max_queue_size:
+            self._spill(self.queue.flush() + [metric])
+            return
+        if self.queue.add(metric) > 0:
+            self.log.error('Queue size over limit, drop metric ({0})'.format(
+                self.queue.policy))
 
     def run(self, zbx):
-        self._flush()
+        try:
+            self._flush()
+        finally:
+            self._send_spool_stats()
 
     def _flush(self):
         metrics = self.queue.flush()
-        if len(metrics) == 0:
+        if self.spool is not None and not self.spool.is_empty():
+            # keep order: fresh metrics go after the spooled ones
+            self._spill(metrics)
+            self._drain()
+            return
+        batches = list(self._batches(metrics))
+        for idx, batch in enumerate(batches):
+            try:
+                self._send_batch(batch)
+            except Exception:
+                if self.spool is not None:
+                    self._spill(sum(batches[idx:], []))
+                raise
+
+    # send spooled metrics in order, move read position after each chunk
+    def _drain(self):
+        for i in range(self.DrainBatches):
+            metrics, position = self.spool.read(self.batch_size)
+            if len(metrics) == 0:
+                break
+            for batch in self._batches(metrics):
+                self._send_batch(batch)
+            self.spool.commit(position)
+
+    # `metrics` and then newer metrics of queue are moved to spool
+    def _spill(self, metrics):
+        metrics = metrics + self.queue.flush()
+        try:
+            self.spool.append(metrics)
+        except (IOError, OSError) as e:
+            self.log.error('Spool write error, drop {0} metrics: {1}'.format(
+                len(metrics), e))
+
+    def _send_spool_stats(self):
+        if self.spool is None:
             return
+        if time.time() - self._last_stats < self.StatsInterval:
+            return
+        self._last_stats = time.time()
+        size, segments = self.spool.backlog()
+        # see health.py
+        self.sender.send('mamonsu.sender.spool[bytes]', size)
+        self.sender.send('mamonsu.sender.spool[segments]', segments)
+        self.sender.send('mamonsu.sender.spool[dropped]', self.spool.dropped)
+
+    def _send_batch(self, batch):
         data = json.dumps({
             'request': 'sender data',
-            'data': metrics,
+            'data': batch,
             'clock': int(time.time())
         })
         self._send_data(data)
 
+    # split metrics by count and by size of json
+    def _batches(self, metrics):
+        batch, batch_bytes = [], 0
+        for metric in metrics:
+            # approximate size of {"host": .., "key": .., ...}
+            size = len(metric['host']) + len(metric['key']) + \
+                len(metric['value']) + 64
+            if len(batch) > 0 and (
+                    len(batch) >= self.batch_size or
+                    batch_bytes + size > self.batch_bytes):
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append(metric)
+            batch_bytes += size
+        if len(batch) > 0:
+            yield batch
+
     def _send_data(self, data):
-        data_len = struct.pack('<Q', len(data))
+        packet = self._packet(data)
+        self.log.debug('request: {0}'.format(data))
+        resp_body = self._request(packet)
+        self.log.debug('response: {0}'.format(resp_body))
+        if 'failed: 0' not in str(resp_body):
+            self.log.error(
+                'On request:\n{0}\nget response'
+                ' with failed items:\n{1}'.format(
+                    data,
+                    resp_body))
+
+    # header: 'ZBXD', flags, data length, uncompressed length (or 0)
+    # flags: 0x01 - zabbix protocol, 0x02 - zlib compression
+    # https://www.zabbix.com/documentation/4.0/manual/appendix/protocols/header_datalen
+    def _packet(self, data):
         if platform.PY3:
-            packet = b'ZBXD\x01' + data_len + str.encode(data)
+            data = str.encode(data)
+        if self.compression:
+            body = zlib.compress(data)
+            header = b'ZBXD\x03' + struct.pack('<II', len(body), len(data))
+        else:
+            body = data
+            header = b'ZBXD\x01' + struct.pack('<Q', len(body))
+        return header + body
+
+    def _request(self, packet):
+        # connection left open by previous request could be closed by server,
+        # in this case retry once with new connection
+        while True:
+            reused = self._sock is not None
+            try:
+                sock = self._connect()
+                sock.sendall(packet)
+                resp_body = self._response(sock)
+            except (socket.error, socket.timeout):
+                self._close()
+                if reused:
+                    continue
+                raise
+            self._keep_or_close(sock)
+            return resp_body
+
+    def _response(self, sock):
+        resp_header = self._receive(sock, 13)
+        if len(resp_header) < 13:
+            raise socket.error('connection closed by server')
+        flags = bytearray(resp_header[4:5])[0]
+        if flags & 0x04:
+            # large packet: 64-bit lengths
+            resp_header += self._receive(sock, 8)
+            body_len, _ = struct.unpack('<QQ', resp_header[5:21])
         else:
-            packet = 'ZBXD\x01' + data_len + data
+            body_len, _ = struct.unpack('<II', resp_header[5:13])
+        resp_body = self._receive(sock, body_len)
+        if flags & 0x02:
+            resp_body = zlib.decompress(resp_body)
+        return resp_body
+
+    def _connect(self):
+        if self._sock is None:
+            sock = socket.create_connection(
+                (self.host, self.port), self.timeout)
+            if self.keepalive:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            self._sock = sock
+        return self._sock
+
+    # zabbix server closes connection after response,
+    # keep connection only if other side leaves it open
+    def _keep_or_close(self, sock):
+        if not self.keepalive:
+            self._close()
+            return
         try:
-            sock = socket.socket()
-            sock.connect((self.host, self.port))
-            self.log.debug('request: {0}'.format(data))
-            sock.sendall(packet)
-            resp_header = self._receive(sock, 13)
-            resp_body_len = struct.unpack('<Q', resp_header[5:])[0]
-            resp_body = self._receive(sock, resp_body_len)
-            self.log.debug('response: {0}'.format(resp_body))
-            if 'failed: 0' not in str(resp_body):
-                self.log.error(
-                    'On request:\n{0}\nget response'
-                    ' with failed items:\n{1}'.format(
-                        data,
-                        resp_body))
-        finally:
-            sock.close()
+            sock.setblocking(0)
+            try:
+                closed = len(sock.recv(1, socket.MSG_PEEK)) == 0
+            except socket.error as e:
+                closed = e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK)
+            sock.settimeout(self.timeout)
+        except socket.error:
+            closed = True
+        if closed:
+            self._close()
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except socket.error:
+                pass
+            self._sock = None
 
     def _receive(self, sock, count):
         buf = str.encode('')
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+import os
+import glob
+import errno
+import json
+import time
+import logging
+import threading
+
+import mamonsu.lib.platform as platform
+
+
+class Spool(object):
+
+    """Append-only on-disk queue of metrics.
+
+    Metrics are stored as json lines in segment files <number>.spool,
+    a new segment is started when the current one is bigger than
+    `segment_size`. Read position is kept in file `offset` and replaced
+    atomically, so after crash reading continues from the last commit.
+    The oldest segments are removed when total size is over `max_size`
+    or when they are older than `max_age` seconds.
+    """
+
+    Suffix = '.spool'
+
+    def __init__(self, directory, max_size, max_age, segment_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self.segment_size = segment_size
+        self.log = logging.getLogger('SPOOL')
+        self.lock = threading.Lock()
+        self.dropped = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._offset_file = os.path.join(directory, 'offset')
+        self._segments = self._list_segments()
+        self._read_pos = self._load_offset()
+        self._fd = None
+
+    # append list of metrics to the last segment
+    def append(self, metrics):
+        if len(metrics) == 0:
+            return
+        data = ''.join(json.dumps(metric) + '\n' for metric in metrics)
+        with self.lock:
+            fd = self._writer()
+            fd.write(data)
+            fd.flush()
+            if fd.tell() > self.segment_size:
+                self._rotate()
+            self._cleanup()
+
+    # read up to `limit` metrics from read position,
+    # return (metrics, position for commit)
+    def read(self, limit):
+        with self.lock:
+            self._cleanup()
+            result = []
+            seq, pos = self._read_pos
+            for segment in self._segments:
+                if segment < seq:
+                    continue
+                if segment > seq:
+                    seq, pos = segment, 0
+                try:
+                    f = open(self._path(seq), 'rb')
+                except (IOError, OSError) as e:
+                    # removed outside, read as empty
+                    if e.errno != errno.ENOENT:
+                        raise
+                    continue
+                with f:
+                    f.seek(pos)
+                    while len(result) < limit:
+                        line = f.readline()
+                        # skip not finished (or torn by crash) line
+                        if not line.endswith(b'\n'):
+                            break
+                        pos += len(line)
+                        try:
+                            result.append(json.loads(line.decode('utf-8')))
+                        except ValueError:
+                            self.log.error(
+                                'Skip broken line in segment {0}'.format(seq))
+                if len(result) >= limit:
+                    break
+            return result, (seq, pos)
+
+    # mark metrics up to position as sent
+    def commit(self, position):
+        with self.lock:
+            self._read_pos = position
+            tmp = self._offset_file + '.tmp'
+            with open(tmp, 'w') as f:
+                f.write('{0} {1}\n'.format(*position))
+                f.flush()
+                os.fsync(f.fileno())
+            if platform.WINDOWS and os.path.exists(self._offset_file):
+                os.remove(self._offset_file)
+            os.rename(tmp, self._offset_file)
+            # remove fully read segments
+            for segment in list(self._segments):
+                if segment < position[0]:
+                    self._remove(segment)
+
+    def is_empty(self):
+        with self.lock:
+            return self._backlog() == 0
+
+    # (bytes, segments) not read yet
+    def backlog(self):
+        with self.lock:
+            return self._backlog(), len(self._segments)
+
+    def _backlog(self):
+        seq, pos, result = self._read_pos[0], self._read_pos[1], 0
+        for segment in self._segments:
+            if segment < seq:
+                continue
+            size = self._size(segment)
+            result += size - pos if segment == seq else size
+        return max(result, 0)
+
+    def _writer(self):
+        if self._fd is None:
+            if len(self._segments) == 0:
+                self._segments.append(self._read_pos[0])
+            self._fd = open(self._path(self._segments[-1]), 'a')
+        return self._fd
+
+    def _rotate(self):
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+        self._segments.append(self._segments[-1] + 1)
+        # listed segment always exists for read
+        self._fd = open(self._path(self._segments[-1]), 'a')
+
+    def _cleanup(self):
+        now = time.time()
+        while len(self._segments) > 1:
+            first = self._segments[0]
+            total = sum(self._size(x) for x in self._segments)
+            try:
+                old = now - os.path.getmtime(
+                    self._path(first)) > self.max_age
+            except OSError:
+                # removed outside, nothing to drop
+                self._segments.remove(first)
+            else:
+                if not (total > self.max_size or old):
+                    break
+                self.log.error(
+                    'Drop spool segment {0}, size limit or age reached'.format(
+                        first))
+                self.dropped += 1
+                self._remove(first)
+            if self._read_pos[0] <= first:
+                self._read_pos = (self._segments[0], 0)
+
+    def _remove(self, segment):
+        try:
+            os.remove(self._path(segment))
+        except OSError as e:
+            self.log.error('Remove segment error: {0}'.format(e))
+        self._segments.remove(segment)
+
+    def _size(self, segment):
+        try:
+            return os.path.getsize(self._path(segment))
+        except OSError:
+            return 0
+
+    def _path(self, segment):
+        return os.path.join(
+            self.directory, '{0:012d}{1}'.format(segment, self.Suffix))
+
+    def _list_segments(self):
+        result = []
+        for filename in glob.glob(
+                os.path.join(self.directory, '*' + self.Suffix)):
+            name = os.path.basename(filename)[:-len(self.Suffix)]
+            if name.isdigit():
+                result.append(int(name))
+        return sorted(result)
+
+    def _load_offset(self):
+        first = self._segments[0] if len(self._segments) > 0 else 0
+        try:
+            with open(self._offset_file, 'r') as f:
+                seq, pos = [int(x) for x in f.read().split()]
+        except (IOError, OSError, ValueError):
+            return (first, 0)
+        if seq < first:
+            return (first, 0)
+        return (seq, pos)
@@ -4,8 +4,15 @@ import time
 
 from mamonsu.lib.sender import *
 from mamonsu.lib.senders import *
+from mamonsu.lib.scheduler import Scheduler
 from mamonsu.tools.agent import *
 from mamonsu.plugins import *
+from mamonsu.plugins.pgsql.plugin import PgsqlPlugin
+from mamonsu.plugins.pgsql.driver.pool import Pool
+import mamonsu.lib.platform as platform
+
+if platform.ASYNC:
+    from mamonsu.plugins.pgsql.driver.aio import AsyncPool
 
 
 class Supervisor(object):
@@ -15,8 +22,9 @@ class Supervisor(object):
     def __init__(self, config):
         self.Plugins = []
         self.config = config
-        self._sender = Sender()
+        self._sender = Sender(config)
         self._senders = []
+        self._scheduler = Scheduler(config)
 
     def start(self):
         self._load_plugins()
@@ -28,6 +36,19 @@ class Supervisor(object):
         for klass in Plugin.only_child_subclasses():
             plugin = klass(self.config)
             self.Plugins.append(plugin)
+        # pgsql plugins for each additional instance with own pool,
+        # others query only the main instance from [postgres]
+        for name, info, host in self.config.instances():
+            pool, async_pool = Pool(info), None
+            if platform.ASYNC:
+                async_pool = AsyncPool(info)
+            for klass in Plugin.only_child_subclasses():
+                if not issubclass(klass, PgsqlPlugin) or \
+                        not klass.PerInstance:
+                    continue
+                plugin = klass(self.config)
+                plugin.set_instance(name, pool, host, async_pool)
+                self.Plugins.append(plugin)
 
     def _update_senders(self):
         for plugin in self.Plugins:
@@ -37,21 +58,37 @@ class Supervisor(object):
 
     def _start_plugins(self):
         for plugin in self.Plugins:
-            if plugin.is_enabled() and not plugin.is_alive():
+            if not plugin.is_enabled():
+                continue
+            if plugin.is_detached():
                 plugin.start()
+            else:
+                self._scheduler.add(plugin)
+        self._scheduler.start()
 
     def _loop(self):
         plugin_errors, plugin_probes, last_error = 0, 0, ''
         while self.Running:
+            # scheduled plugins are never stopped, watch only detached
             for plugin in self.Plugins:
+                if not plugin.is_detached():
+                    continue
                 if plugin.is_enabled() and not plugin.is_alive():
                     plugin.start()
                     last_error = plugin.last_error_text
                     plugin_errors += 1
             time.sleep(10)
-            # error counts
+            # scheduler stats every minute
             plugin_probes += 1
+            if plugin_probes % 6 == 0:
+                self._send_scheduler_stats()
+                self._send_sender_stats()
+            # error counts
             if plugin_probes >= 60:
+                errors, error = self._scheduler.take_errors()
+                plugin_errors += errors
+                if errors > 0:
+                    last_error = error
                 if plugin_errors > 0:
                     self._sender.send(
                         'mamonsu.plugin.errors[]',
@@ -61,3 +98,56 @@ class Supervisor(object):
                 else:
                     self._sender.send('mamonsu.plugin.errors[]', '')
                 plugin_errors, plugin_probes = 0, 0
+
+    def _send_scheduler_stats(self):
+        plugins, missed = [], 0
+        for name, stats in self._scheduler.take_stats():
+            plugins.append({'{#PLUGIN}': name})
+            missed += stats['missed']
+            self._sender.send(
+                'mamonsu.plugin.skew[{0}]'.format(name), stats['skew'])
+            self._sender.send(
+                'mamonsu.plugin.duration[{0}]'.format(name),
+                stats['duration'])
+            self._sender.send(
+                'mamonsu.plugin.interval[{0}]'.format(name),
+                stats['interval'])
+            self._sender.send(
+                'mamonsu.plugin.overruns[{0}]'.format(name),
+                stats['overruns'], Plugin.DELTA.simple_change)
+            for bucket, count in stats['histogram']:
+                self._sender.send(
+                    'mamonsu.plugin.runs[{0},{1}]'.format(name, bucket),
+                    count, Plugin.DELTA.simple_change)
+        self._sender.send(
+            'mamonsu.plugin.discovery[]', self._sender.json({'data': plugins}))
+        self._sender.send(
+            'mamonsu.scheduler[missed]', missed,
+            Plugin.DELTA.simple_change)
+        self._sender.send(
+            'mamonsu.scheduler[busy]', self._scheduler.workers.busy())
+        self._sender.send(
+            'mamonsu.scheduler[pending]', self._scheduler.workers.pending())
+
+    def _send_sender_stats(self):
+        for name, stats in self._sender.take_stats():
+            self._sender.send(
+                'mamonsu.sender.latency[{0}]'.format(name), stats['latency'])
+            self._sender.send(
+                'mamonsu.sender.backlog[{0}]'.format(name), stats['backlog'])
+            self._sender.send(
+                'mamonsu.sender.delivered[{0}]'.format(name),
+                stats['delivered'], Plugin.DELTA.simple_change)
+            self._sender.send(
+                'mamonsu.sender.channel_dropped[{0}]'.format(name),
+                stats['dropped'], Plugin.DELTA.simple_change)
+        for plugin in self.Plugins:
+            if not (plugin.is_sender() and plugin.is_enabled()):
+                continue
+            # external senders could have no queue
+            if getattr(plugin, 'queue', None) is None:
+                continue
+            self._sender.send(
+                'mamonsu.sender.dropped[{0}]'.format(
+                    plugin.__class__.__name__.lower()),
+                plugin.queue.dropped, Plugin.DELTA.simple_change)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+import threading
+import traceback
+
+import mamonsu.lib.platform as platform
+
+if platform.PY2:
+    import Queue as queue
+else:
+    import queue
+
+
+class Task(object):
+
+    def __init__(self, func, args):
+        self.func, self.args = func, args
+        self.result, self.error, self.trace = None, None, None
+        self.started, self.finished = None, None
+        self._done = threading.Event()
+
+    def run(self):
+        self.started = time.time()
+        try:
+            self.result = self.func(*self.args)
+        except Exception as e:
+            self.error = e
+            self.trace = traceback.format_exc()
+        finally:
+            self.finished = time.time()
+            self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    # wait for task, return True if task is finished
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.done()
+
+    def duration(self):
+        if self.started is None:
+            return None
+        return (self.finished or time.time()) - self.started
+
+
+class WorkerPool(object):
+
+    def __init__(self, size, name='worker'):
+        self.size = max(int(size), 1)
+        self.name = name
+        self.log = logging.getLogger(name.upper())
+        self._tasks = queue.Queue()
+        self._threads = []
+        self._busy = 0
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args):
+        task = Task(func, args)
+        self._spawn()
+        self._tasks.put(task)
+        return task
+
+    # count of workers which execute task right now
+    def busy(self):
+        with self._lock:
+            return self._busy
+
+    # count of tasks waiting for free worker
+    def pending(self):
+        return self._tasks.qsize()
+
+    # workers are started on demand and never exit
+    def _spawn(self):
+        with self._lock:
+            if len(self._threads) >= self.size:
+                return
+            if self._busy + self._tasks.qsize() < len(self._threads):
+                return
+            thread = threading.Thread(
+                target=self._work,
+                name='{0}-{1}'.format(self.name, len(self._threads)))
+            thread.daemon = True
+            self._threads.append(thread)
+        thread.start()
+
+    def _work(self):
+        while True:
+            task = self._tasks.get()
+            with self._lock:
+                self._busy += 1
+            try:
+                task.run()
+            finally:
+                with self._lock:
+                    self._busy -= 1
@@ -1,5 +1,6 @@
 import mamonsu.lib.platform as platform
 from mamonsu.lib.plugin import Plugin
+from mamonsu.lib.scheduler import Job
 
 if platform.LINUX:
     import resource
@@ -30,6 +31,49 @@ class Health(Plugin):
         }) + template.item({
             'name': 'Mamonsu: plugin keep alive',
             'key': 'mamonsu.plugin.keepalive[]'
+        }) + template.item({
+            'name': 'Mamonsu: scheduler missed plugin runs',
+            'key': 'mamonsu.scheduler[missed]'
+        }) + template.item({
+            'name': 'Mamonsu: scheduler busy workers',
+            'key': 'mamonsu.scheduler[busy]'
+        }) + template.item({
+            'name': 'Mamonsu: scheduler plugin runs waiting for worker',
+            'key': 'mamonsu.scheduler[pending]'
+        })
+        # see supervisor.py:
+        for sender in ('zbxsender', 'logsender'):
+            result += template.item({
+                'name': 'Mamonsu: metrics dropped by {0} queue'.format(
+                    sender),
+                'key': 'mamonsu.sender.dropped[{0}]'.format(sender)
+            }) + template.item({
+                'name': 'Mamonsu: max {0} channel latency'.format(sender),
+                'key': 'mamonsu.sender.latency[{0}]'.format(sender),
+                'units': Plugin.UNITS.s
+            }) + template.item({
+                'name': 'Mamonsu: {0} channel backlog'.format(sender),
+                'key': 'mamonsu.sender.backlog[{0}]'.format(sender)
+            }) + template.item({
+                'name': 'Mamonsu: metrics delivered by {0} channel'.format(
+                    sender),
+                'key': 'mamonsu.sender.delivered[{0}]'.format(sender)
+            }) + template.item({
+                'name': 'Mamonsu: sends dropped by {0} channel'.format(
+                    sender),
+                'key': 'mamonsu.sender.channel_dropped[{0}]'.format(sender)
+            })
+        # see senders/zbx.py, sent only if [sender] spool is set:
+        result += template.item({
+            'name': 'Mamonsu: spooled metrics not sent yet',
+            'key': 'mamonsu.sender.spool[bytes]',
+            'units': Plugin.UNITS.bytes
+        }) + template.item({
+            'name': 'Mamonsu: spool segments',
+            'key': 'mamonsu.sender.spool[segments]'
+        }) + template.item({
+            'name': 'Mamonsu: spool segments dropped by size or age',
+            'key': 'mamonsu.sender.spool[dropped]'
         })
         if platform.LINUX:
             result += template.item({
@@ -39,6 +83,49 @@ class Health(Plugin):
             })
         return result
 
+    def discovery_rules(self, template):
+        # see supervisor.py:
+        rule = {
+            'name': 'Mamonsu plugin discovery',
+            'key': 'mamonsu.plugin.discovery[]',
+            'filter': '{#PLUGIN}:.*'
+        }
+        items = [
+            {'key': 'mamonsu.plugin.skew[{#PLUGIN}]',
+                'name': 'Mamonsu plugin {#PLUGIN}: max start delay',
+                'units': Plugin.UNITS.s},
+            {'key': 'mamonsu.plugin.duration[{#PLUGIN}]',
+                'name': 'Mamonsu plugin {#PLUGIN}: max run duration',
+                'units': Plugin.UNITS.s},
+            {'key': 'mamonsu.plugin.interval[{#PLUGIN}]',
+                'name': 'Mamonsu plugin {#PLUGIN}: current interval',
+                'units': Plugin.UNITS.s},
+            {'key': 'mamonsu.plugin.overruns[{#PLUGIN}]',
+                'name': 'Mamonsu plugin {#PLUGIN}: runs longer than interval'}
+        ]
+        graphs = [{
+            'name': 'Mamonsu plugin {#PLUGIN}: timing',
+            'items': [
+                {'color': 'CC0000',
+                    'key': 'mamonsu.plugin.skew[{#PLUGIN}]'},
+                {'color': '0000CC',
+                    'key': 'mamonsu.plugin.duration[{#PLUGIN}]'}]
+        }]
+        # run duration histogram
+        colors = ['00CC00', '0000CC', 'CCCC00', 'CC00CC', 'CC0000', '000000']
+        histogram = []
+        for idx, bucket in enumerate(Job.Buckets):
+            key = 'mamonsu.plugin.runs[{#PLUGIN},' + bucket[1] + ']'
+            items.append({
+                'key': key,
+                'name': 'Mamonsu plugin {#PLUGIN}: runs up to ' + bucket[1]})
+            histogram.append({'key': key, 'color': colors[idx]})
+        graphs.append({
+            'name': 'Mamonsu plugin {#PLUGIN}: run duration histogram',
+            'type': self.GRAPH_TYPE.stacked,
+            'items': histogram})
+        return template.discovery_rule(rule=rule, items=items, graphs=graphs)
+
     def triggers(self, template):
         result = template.trigger({
             'name': 'Mamonsu plugin errors '
@@ -2,6 +2,6 @@ __all__ = ['bgwriter', 'connections', 'databases']
 __all__ += ['health', 'instance', 'xlog']
 __all__ += ['pg_stat_statement', 'pg_buffercache', 'pg_wait_sampling']
 __all__ += ['checkpoint', 'oldest', 'pg_locks']
-__all__ += ['cfs']
+__all__ += ['cfs', 'processes']
 
 from . import *
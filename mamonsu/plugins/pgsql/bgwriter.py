@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 
 from mamonsu.plugins.pgsql.plugin import PgsqlPlugin as Plugin
-from .pool import Pooler
 
 
 class BgWriter(Plugin):
 
+    PerInstance = True
+
     Items = [
         # key, zbx_key, description,
         #    ('graph name', color, side), units, delta
@@ -43,7 +44,7 @@ class BgWriter(Plugin):
 
     def run(self, zbx):
         params = [x[0] for x in self.Items]
-        result = Pooler.query(
+        result = self.pool.query(
             'select {0} from pg_catalog.pg_stat_bgwriter'.format(
                 ', '.join(params)))
         for idx, val in enumerate(result[0]):
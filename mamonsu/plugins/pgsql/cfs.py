@@ -1,16 +1,20 @@
 # -*- coding: utf-8 -*-
 
 from mamonsu.plugins.pgsql.plugin import PgsqlPlugin as Plugin
-from .pool import Pooler
 
 
 class Cfs(Plugin):
 
+    PerInstance = True
+
     ratioInterval, ratioCounter = 10, 0
     timeRatioInterval = ratioInterval * 60
 
     DEFAULT_CONFIG = {'force_enable': str(False)}
 
+    # compress ratios of relations sent at once
+    RatioChunk = 1000
+
     compressed_ratio_sql = """
 select
     n.nspname || '.' || c.relname as table_name,
@@ -52,20 +56,26 @@ select
 
         if self.ratioCounter == self.ratioInterval:
             relations, compressed_size, non_compressed_size = [], 0, 0
-            for db in Pooler.databases():
-                for row in Pooler.query(self.compressed_ratio_sql, db):
+            ratios = []
+            for db in self.pool.databases():
+                # relations are streamed, ratios are sent by chunks
+                for row in self.pool.query_iter(self.compressed_ratio_sql, db):
                     relation_name = '{0}.{1}'.format(db, row[0])
                     relations.append({'{#COMPRESSED_RELATION}': relation_name})
                     compressed_size += row[2]
                     non_compressed_size += row[2] * row[1]
-                    zbx.send('pgsql.cfs.compress_ratio[{0}]'.format(relation_name), row[1])
+                    ratios.append(('pgsql.cfs.compress_ratio[{0}]'.format(relation_name), row[1]))
+                    if len(ratios) >= self.RatioChunk:
+                        zbx.send_many(ratios)
+                        ratios = []
+            zbx.send_many(ratios)
             zbx.send('pgsql.cfs.discovery_compressed_relations[]', zbx.json({'data': relations}))
             zbx.send('pgsql.cfs.activity[total_compress_ratio]', non_compressed_size / compressed_size)
-            del(relations, compressed_size, non_compressed_size)
+            del(relations, ratios, compressed_size, non_compressed_size)
             self.ratioCounter = 0
         self.ratioCounter += 1
 
-        info = Pooler.query(self.activity_sql)[0]
+        info = self.pool.query(self.activity_sql)[0]
         zbx.send('pgsql.cfs.activity[written_bytes]', info[0], delta=self.DELTA_SPEED, only_positive_speed=True)
         zbx.send('pgsql.cfs.activity[scanned_bytes]', info[1], delta=self.DELTA_SPEED, only_positive_speed=True)
 
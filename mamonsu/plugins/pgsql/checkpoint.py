@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 
 from mamonsu.plugins.pgsql.plugin import PgsqlPlugin as Plugin
-from .pool import Pooler
 
 
 class Checkpoint(Plugin):
 
+    PerInstance = True
+
     Interval = 60 * 5
 
     DEFAULT_CONFIG = {'max_checkpoint_by_wal_in_hour': str(12)}
@@ -37,7 +38,7 @@ class Checkpoint(Plugin):
 
     def run(self, zbx):
         params = [x[0] for x in self.Items]
-        result = Pooler.query(
+        result = self.pool.query(
             'select {0} from pg_catalog.pg_stat_bgwriter'.format(
                 ', '.join(params)))
         for idx, val in enumerate(result[0]):
@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 
 from mamonsu.plugins.pgsql.plugin import PgsqlPlugin as Plugin
-from .pool import Pooler
 
 
 class Connections(Plugin):
 
+    PerInstance = True
+
     # (state, key, name, graph)
     Items = [
         ('active', 'active', 'number of active connections', '00BB00'),
@@ -16,26 +17,17 @@ class Connections(Plugin):
 
     def run(self, zbx):
 
-        result = Pooler.query('select state, count(*) \
-            from pg_catalog.pg_stat_activity group by state')
+        activity = self.pool.activity()
         for item in self.Items:
-            state, key, val = item[0], item[1], 0
-            for row in result:
-                if row[0] != state:
-                    continue
-                else:
-                    val = row[1]
-                    break
-            zbx.send('pgsql.connections[{0}]'.format(key), float(val))
+            key = item[1]
+            zbx.send(
+                'pgsql.connections[{0}]'.format(key),
+                float(activity[key] or 0))
 
-        result = Pooler.query('select count(*) \
-            from pg_catalog.pg_stat_activity')
-        zbx.send('pgsql.connections[total]', int(result[0][0]))
+        zbx.send('pgsql.connections[total]', int(activity['total']))
 
-        if Pooler.server_version_less('9.5.0'):
-            result = Pooler.query('select count(*) \
-                from pg_catalog.pg_stat_activity where waiting')
-            zbx.send('pgsql.connections[waiting]', int(result[0][0]))
+        if self.pool.server_version_less('9.5.0'):
+            zbx.send('pgsql.connections[waiting]', int(activity['waiting']))
 
     def items(self, template):
         result = template.item({
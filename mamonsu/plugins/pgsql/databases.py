@@ -1,42 +1,114 @@
 # -*- coding: utf-8 -*-
 
+import time
+
+from mamonsu.lib.workers import WorkerPool
 from mamonsu.plugins.pgsql.plugin import PgsqlPlugin as Plugin
-from .pool import Pooler
 
 
 class Databases(Plugin):
 
+    PerInstance = True
+
     Interval = 60 * 5
 
-    DEFAULT_CONFIG = {'min_rows': str(50), 'bloat_scale': str(0.2)}
+    # bloat is counted in each database in parallel by `workers`,
+    # a database which does not answer in `db_timeout` seconds is skipped
+    DEFAULT_CONFIG = {
+        'min_rows': str(50), 'bloat_scale': str(0.2),
+        'workers': str(4), 'db_timeout': str(30)}
+
+    def __init__(self, config):
+        super(Databases, self).__init__(config)
+        self.workers = WorkerPool(
+            int(self.plugin_config('workers')), 'databases')
+        # the last bloat task of each database
+        self._tasks = {}
 
     def run(self, zbx):
 
-        result = Pooler.query('select \
+        result = self.pool.query('select \
             datname, pg_database_size(datname::text), age(datfrozenxid) \
             from pg_catalog.pg_database where datistemplate = false')
-        dbs = []
+        dbs, metrics = [], []
         for info in result:
             dbs.append({'{#DATABASE}': info[0]})
-            zbx.send('pgsql.database.size[{0}]'.format(
-                info[0]), int(info[1]))
-            zbx.send('pgsql.database.max_age[{0}]'.format(
-                info[0]), int(info[2]))
-            bloat_count = Pooler.query(
-                'select count(*) from pg_catalog.pg_stat_all_tables where\
-                (n_dead_tup/(n_live_tup+n_dead_tup)::float8) > {0}\
-                and (n_live_tup+n_dead_tup) > {1}'.format(
-                    self.plugin_config('bloat_scale'),
-                    self.plugin_config('min_rows')),
-                info[0])[0][0]
-            zbx.send(
-                'pgsql.database.bloating_tables[{0}]'.format(info[0]),
-                int(bloat_count))
+            metrics.append((
+                'pgsql.database.size[{0}]'.format(info[0]), int(info[1])))
+            metrics.append((
+                'pgsql.database.max_age[{0}]'.format(info[0]), int(info[2])))
+        for db, task in self._bloat([info[0] for info in result]):
+            if task.done() and task.result is None and task.error is None:
+                # skipped after its cycle
+                continue
+            if task.done() and task.result is not None:
+                metrics.append((
+                    'pgsql.database.bloating_tables[{0}]'.format(db),
+                    int(task.result)))
+            if task.duration() is not None:
+                metrics.append((
+                    'pgsql.database.bloat_duration[{0}]'.format(db),
+                    task.duration()))
+        zbx.send_many(metrics)
         zbx.send('pgsql.database.discovery[]', zbx.json({'data': dbs}))
-        del dbs, bloat_count
+        del dbs, metrics
 
-        result = Pooler.run_sql_type('count_autovacuum')
-        zbx.send('pgsql.autovacumm.count[]', int(result[0][0]) - 1)
+        # without bootstrap the count is taken from the shared activity scan
+        if self.pool.is_bootstraped():
+            count = self.pool.run_sql_type('count_autovacuum')[0][0]
+        else:
+            count = self.pool.activity()['autovacuum']
+        zbx.send('pgsql.autovacumm.count[]', int(count) - 1)
+
+    # count bloating tables in all databases, return [(db, task)],
+    # tasks which are not finished in time are left running and the
+    # database is not submitted again until its task is finished
+    def _bloat(self, databases):
+        timeout = float(self.plugin_config('db_timeout'))
+        started = time.time()
+        # result is stale after the next cycle is started
+        deadline = started + self.Interval
+        tasks = []
+        for db in databases:
+            task = self._tasks.get(db)
+            if task is None or task.done():
+                task = self.workers.submit(self._bloat_count, db, deadline)
+            else:
+                self.log.debug(
+                    'Bloat query in database {0} of previous '
+                    'run is not finished'.format(db))
+            tasks.append((db, task))
+        self._tasks = dict(tasks)
+        for db, task in tasks:
+            while not task.done():
+                if task.started is None:
+                    # waits for a free worker, not longer than timeout
+                    if time.time() - started > timeout:
+                        break
+                    task.wait(0.1)
+                elif not task.wait(task.started + timeout - time.time()):
+                    break
+            if not task.done():
+                self.log.error(
+                    'Bloat query in database {0} is not finished '
+                    'in {1}s, skip it'.format(db, timeout))
+            elif task.error is not None:
+                self.log.error(
+                    'Bloat query in database {0} error: {1}'.format(
+                        db, task.error))
+        return tasks
+
+    # None if the task waited for a worker till the end of its cycle
+    def _bloat_count(self, db, deadline):
+        if time.time() > deadline:
+            return None
+        return self.pool.query(
+            'select count(*) from pg_catalog.pg_stat_all_tables where\
+            (n_dead_tup/(n_live_tup+n_dead_tup)::float8) > {0}\
+            and (n_live_tup+n_dead_tup) > {1}'.format(
+                self.plugin_config('bloat_scale'),
+                self.plugin_config('min_rows')),
+            db)[0][0]
 
     def items(self, template):
         return template.item({
@@ -62,6 +134,10 @@ class Databases(Plugin):
                 'delay': self.Interval},
             {'key': 'pgsql.database.bloating_tables[{#DATABASE}]',
                 'name': 'Count of bloating tables in database: {#DATABASE}',
+                'delay': self.Interval},
+            {'key': 'pgsql.database.bloat_duration[{#DATABASE}]',
+                'name': 'Duration of bloat query in database: {#DATABASE}',
+                'units': Plugin.UNITS.s,
                 'delay': self.Interval}
         ]
         graphs = [
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+
+
+class Cache(object):
+
+    """Values of metadata queries by (name, db, arg) for ttl seconds.
+    A value is fetched once at a time, other callers wait for it."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, db, arg): (expire time, value)
+        self._values = {}
+        self._fetch_locks = {}
+        # name: [hits, misses]
+        self._stats = {}
+
+    def get(self, name, db, ttl, fetch, arg=None):
+        key = (name, db, arg)
+        with self.lock:
+            fetch_lock = self._fetch_locks.setdefault(key, threading.Lock())
+        with fetch_lock:
+            with self.lock:
+                stats = self._stats.setdefault(name, [0, 0])
+                entry = self._values.get(key)
+                if entry is not None and entry[0] > time.time():
+                    stats[0] += 1
+                    return entry[1]
+                stats[1] += 1
+            value = fetch()
+            with self.lock:
+                self._values[key] = (time.time() + ttl, value)
+            return value
+
+    # forget values of database (all if db is None) and name (all if None)
+    def invalidate(self, db=None, name=None):
+        with self.lock:
+            for key in list(self._values):
+                if db is not None and key[1] != db:
+                    continue
+                if name is not None and key[0] != name:
+                    continue
+                del self._values[key]
+
+    # {name: (hits, misses)} since start
+    def stats(self):
+        with self.lock:
+            return dict(
+                (name, tuple(value)) for name, value in self._stats.items())
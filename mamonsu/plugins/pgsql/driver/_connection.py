@@ -3,10 +3,19 @@ import os
 import threading
 import logging
 
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
 from mamonsu.plugins.pgsql.driver.pg8000 import connect
 from mamonsu.plugins.pgsql.driver.pg8000.core import ProgrammingError
 
 
+class PoolTimeoutError(Exception):
+    pass
+
+
 class ConnectionInfo(object):
 
     def __init__(self, info={}):
@@ -19,6 +28,16 @@ class ConnectionInfo(object):
         self.timeout = self.info.get('timeout') or int(
             os.environ.get('PGTIMEOUT') or 1)
         self.appname = self.info.get('appname') or os.environ.get('PGAPPNAME')
+        self.pool_min = self.info.get('pool_min') or int(
+            os.environ.get('PGPOOLMIN') or 1)
+        self.pool_max = self.info.get('pool_max') or int(
+            os.environ.get('PGPOOLMAX') or 1)
+        self.pool_idle = self.info.get('pool_idle') or int(
+            os.environ.get('PGPOOLIDLE') or 300)
+        self.pool_timeout = self.info.get('pool_timeout') or int(
+            os.environ.get('PGPOOLTIMEOUT') or 10)
+        self.activity_staleness = self.info.get('activity_staleness') or int(
+            os.environ.get('PGACTIVITYSTALENESS') or 0)
         self.log = logging.getLogger('PGSQL-({0})'.format(self.conn_str()))
 
     def conn_str(self):
@@ -28,33 +47,100 @@ class ConnectionInfo(object):
 
 class Connection(ConnectionInfo):
 
+    # rows fetched at once by query_iter
+    FetchSize = 1000
+
     def __init__(self, info={}):
-        super(Connection, self).__init__()
+        super(Connection, self).__init__(info)
         self.lock = threading.Lock()
         self.conn = None
         self.connected = False
+        # QueryStats of pool
+        self.stats = self.info.get('stats')
 
     def query(self, query):
         self.lock.acquire()
+        start, received, result, error = monotonic(), None, None, True
         try:
             self.log.debug('Run: "{0}"'.format(query))
             self._check_connect()
+            received = self.conn.bytes_received
             self.connected = False
             cursor = self.conn.cursor()
             cursor.execute(query)
             result = cursor.fetchall()
             cursor.close()
             self.connected = True
+            error = False
         except ProgrammingError as e:
             error_text = '{0}'.format(e)
             if error_text == 'no result set':
+                error = False
                 return None
             else:
                 raise ProgrammingError(error_text)
         finally:
+            self._record(
+                query, start, len(result or ()), received, error)
             self.lock.release()
         return result
 
+    # iterate rows of query, fetched from portal by fetch_size rows,
+    # the connection is locked until iteration is finished or closed
+    def query_iter(self, query, fetch_size=None):
+        if fetch_size is None:
+            fetch_size = self.FetchSize
+        self.lock.acquire()
+        # time includes processing of rows by caller
+        start, received, rows, error = monotonic(), None, 0, True
+        try:
+            self.log.debug('Run: "{0}"'.format(query))
+            self._check_connect()
+            received = self.conn.bytes_received
+            self.connected = False
+            # portal outlives single Sync only inside transaction
+            self.conn.autocommit = False
+            cursor = self.conn.cursor()
+            cursor.fetch_size = fetch_size
+            cursor.execute(query)
+            for row in cursor:
+                rows += 1
+                yield row
+            cursor.close()
+            self.conn.rollback()
+            self.conn.autocommit = True
+            self.connected = True
+            error = False
+        except GeneratorExit:
+            # iteration stopped by caller
+            error = False
+            raise
+        finally:
+            if not self.connected:
+                # iteration stopped by caller, end transaction
+                # (and close portal) or reconnect on next query
+                self._end_transaction()
+            self._record(query, start, rows, received, error)
+            self.lock.release()
+
+    def _record(self, query, start, rows, received, error):
+        if self.stats is None:
+            return
+        if received is not None:
+            received = self.conn.bytes_received - received
+        self.stats.record(
+            query, self.db, monotonic() - start, rows, received or 0, error)
+
+    def _end_transaction(self):
+        if self.conn is None:
+            return
+        try:
+            self.conn.rollback()
+            self.conn.autocommit = True
+            self.connected = True
+        except Exception as e:
+            self.log.error('rollback error: {0}'.format(e))
+
     def _close(self):
         if self.conn is not None:
             self.log.debug('closing old connection')
@@ -64,11 +150,18 @@ class Connection(ConnectionInfo):
                 self.log.error('close error: {0}'.format(e))
 
     def _connect(self):
+        reconnect = self.conn is not None
         self.log.debug('connecting')
         host, unix_sock = self.host, None
         if host.startswith('/'):
             unix_sock, host = host, None
+        # connect and each read of socket, longer than statement_timeout
+        # to get error from server, None (wait forever) without it
+        timeout = None
+        if self.timeout > 0:
+            timeout = self.timeout * 2
         self.conn = connect(
+            timeout=timeout,
             user=self.user,
             password=self.passwd,
             unix_sock=unix_sock,
@@ -83,9 +176,110 @@ class Connection(ConnectionInfo):
         cur.execute('set statement_timeout to {0}'.format(self.timeout * 1000))
         cur.close()
         self.log.debug('ready')
+        # server could be restarted or switched, forget its metadata
+        if reconnect and self.info.get('on_reconnect') is not None:
+            self.info['on_reconnect']()
 
     def _check_connect(self):
         if not self.connected:
             self.log.debug('reconnecting')
             self._close()
             self._connect()
+
+
+class ConnectionPool(ConnectionInfo):
+
+    """Connections to one database: up to pool_max are opened on demand,
+    connections idle for pool_idle seconds are closed down to pool_min."""
+
+    def __init__(self, info={}):
+        super(ConnectionPool, self).__init__(info)
+        self.info = info
+        self._cond = threading.Condition()
+        # [(connection, monotonic time of checkin)], the last is the newest
+        self._idle = []
+        self._size = 0
+        # checkout stats: since start and max wait since last take_stats()
+        self.checkouts, self.waits, self.wait_time = 0, 0, 0
+        self.max_wait = 0
+
+    def query(self, query):
+        conn = self._checkout()
+        try:
+            return conn.query(query)
+        finally:
+            self._checkin(conn)
+
+    def query_iter(self, query, fetch_size=None):
+        conn = self._checkout()
+        rows = conn.query_iter(query, fetch_size)
+        try:
+            for row in rows:
+                yield row
+        finally:
+            # end transaction before connection is returned
+            rows.close()
+            self._checkin(conn)
+
+    # close connections idle for too long
+    def reap(self):
+        closed = []
+        with self._cond:
+            deadline = monotonic() - self.pool_idle
+            while len(self._idle) > 0 and self._size > self.pool_min:
+                conn, checkin = self._idle[0]
+                if checkin > deadline:
+                    break
+                self._idle.pop(0)
+                self._size -= 1
+                closed.append(conn)
+        for conn in closed:
+            conn._close()
+        return len(closed)
+
+    def take_stats(self):
+        with self._cond:
+            result = {
+                'connections': self._size,
+                'idle': len(self._idle),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_time': self.wait_time,
+                'max_wait': self.max_wait}
+            self.max_wait = 0
+        return result
+
+    def _checkout(self):
+        start, waited = monotonic(), False
+        with self._cond:
+            while True:
+                if len(self._idle) > 0:
+                    # the most recently used one, others could be reaped
+                    conn = self._idle.pop()[0]
+                    break
+                if self._size < self.pool_max:
+                    self._size += 1
+                    conn = Connection(self.info)
+                    break
+                # connections are held by hung queries
+                left = start + self.pool_timeout - monotonic()
+                if left <= 0:
+                    raise PoolTimeoutError(
+                        'no free connection to {0} in {1}s, all {2} '
+                        'are busy'.format(
+                            self.conn_str(), self.pool_timeout,
+                            self.pool_max))
+                waited = True
+                self._cond.wait(left)
+            wait = monotonic() - start
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_time += wait
+                self.max_wait = max(self.max_wait, wait)
+        return conn
+
+    def _checkin(self, conn):
+        with self._cond:
+            self._idle.append((conn, monotonic()))
+            self._cond.notify()
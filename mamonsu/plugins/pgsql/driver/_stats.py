@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import re
+import zlib
+import threading
+
+# literals replaced in query fingerprint
+_literals = re.compile(
+    r"'(?:[^']|'')*'|\$\d+|\b\d+(?:\.\d+)?\b", re.UNICODE)
+_spaces = re.compile(r'\s+', re.UNICODE)
+
+
+def fingerprint(query):
+    """Query text without literals and extra spaces, so queries which
+    differ only by constants are counted together."""
+    return _spaces.sub(' ', _literals.sub('?', query)).strip()
+
+
+class QueryStats(object):
+
+    """Counters of queries by (fingerprint, database): calls, errors,
+    rows, bytes received and run time with histogram."""
+
+    # run time histogram: (upper bound in seconds, name)
+    Buckets = [
+        (0.01, '10ms'), (0.1, '100ms'), (1, '1s'),
+        (10, '10s'), (None, 'inf')]
+
+    # bound memory if queries are generated with unusual literals:
+    # (fingerprint, db) pairs over the limit are counted as 'other',
+    # cache of fingerprints by query text is cleared when full
+    MaxEntries = 500
+
+    # stats of all pools, for agent api: [(pool name, QueryStats)]
+    registry = []
+
+    def __init__(self, name=None):
+        self.lock = threading.Lock()
+        # query text: (fingerprint id, fingerprint)
+        self._fingerprints = {}
+        # (fingerprint id, db): counters
+        self._stats = {}
+        if name is not None:
+            QueryStats.registry.append((name, self))
+
+    def record(self, query, db, duration, rows, received, error):
+        with self.lock:
+            ident, text = self._fingerprint(query)
+            stats = self._stats.get((ident, db))
+            if stats is None and len(self._stats) >= self.MaxEntries:
+                ident, text = 'other', 'other'
+                stats = self._stats.get((ident, db))
+            if stats is None:
+                stats = self._stats[(ident, db)] = {
+                    'query': text, 'calls': 0, 'errors': 0, 'rows': 0,
+                    'bytes': 0, 'time': 0.0, 'max_time': 0.0,
+                    'histogram': [0] * len(self.Buckets)}
+            stats['calls'] += 1
+            if error:
+                stats['errors'] += 1
+            stats['rows'] += rows
+            stats['bytes'] += received
+            stats['time'] += duration
+            stats['max_time'] = max(stats['max_time'], duration)
+            for idx, bucket in enumerate(self.Buckets):
+                if bucket[0] is None or duration <= bucket[0]:
+                    stats['histogram'][idx] += 1
+                    break
+
+    # [(fingerprint id, db, stats)], counters since start and
+    # max_time since the last call with reset
+    def take_stats(self, reset=True):
+        result = []
+        with self.lock:
+            for (ident, db), stats in self._stats.items():
+                item = dict(stats)
+                item['histogram'] = [
+                    (bucket[1], count) for bucket, count in zip(
+                        self.Buckets, stats['histogram'])]
+                result.append((ident, db, item))
+                if reset:
+                    stats['max_time'] = 0.0
+        return sorted(result, key=lambda x: (x[0], x[1] or ''))
+
+    def _fingerprint(self, query):
+        result = self._fingerprints.get(query)
+        if result is None:
+            if len(self._fingerprints) >= self.MaxEntries:
+                self._fingerprints.clear()
+            text = fingerprint(query)
+            data = text if isinstance(text, bytes) else text.encode('utf-8')
+            ident = '{0:08x}'.format(zlib.crc32(data) & 0xffffffff)
+            result = self._fingerprints[query] = (ident, text)
+        return result
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+
+# Minimal asyncio PostgreSQL client for plugins with `async def run`:
+# simple query protocol, trust, password, md5 and scram-sha-256
+# authentication, results in text format. Python 3 only.
+
+import os
+import hmac
+import base64
+import asyncio
+import struct
+import logging
+from hashlib import md5, sha256, pbkdf2_hmac
+from decimal import Decimal
+
+from mamonsu.plugins.pgsql.driver.pg8000.core import ProgrammingError
+from ._connection import ConnectionInfo
+
+# type oid: function to convert text value
+Decoders = {
+    16: lambda x: x == 't',
+    20: int, 21: int, 23: int, 26: int, 28: int,
+    700: float, 701: float,
+    1700: Decimal,
+}
+
+
+class AsyncConnection(ConnectionInfo):
+
+    def __init__(self, info={}):
+        super(AsyncConnection, self).__init__(info)
+        self.reader, self.writer = None, None
+        self.encoding = 'utf-8'
+        # state of scram exchange: (client first message bare, nonce)
+        # and then (auth message, salted password)
+        self._scram = None
+
+    async def query(self, query):
+        if self.writer is None:
+            try:
+                await self._connect()
+            except Exception:
+                await self.close()
+                raise
+        self.log.debug('Run: "{0}"'.format(query))
+        self._send(b'Q', query.encode(self.encoding) + b'\x00')
+        await self.writer.drain()
+        result, decoders, error = None, None, None
+        while True:
+            code, data = await self._receive()
+            if code == b'T':
+                decoders, result = self._row_description(data), []
+            elif code == b'D':
+                result.append(self._row(data, decoders))
+            elif code == b'E':
+                error = self._error(data)
+            elif code == b'Z':
+                break
+        if error is not None:
+            raise error
+        if result is None:
+            return None
+        return result
+
+    async def close(self):
+        if self.writer is None:
+            return
+        try:
+            self._send(b'X', b'')
+            self.writer.close()
+        except Exception as e:
+            self.log.error('close error: {0}'.format(e))
+        self.reader, self.writer = None, None
+
+    async def _connect(self):
+        self.log.debug('connecting')
+        if self.host.startswith('/'):
+            # socket file (host = auto) or its directory
+            path = self.host
+            if os.path.isdir(path):
+                path = '{0}/.s.PGSQL.{1}'.format(path, self.port)
+            self.reader, self.writer = await asyncio.open_unix_connection(
+                path)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port)
+        params = [
+            ('user', self.user), ('database', self.db),
+            ('application_name', self.appname), ('client_encoding', 'UTF8')]
+        body = struct.pack('!i', 196608)
+        for key, value in params:
+            if value is not None:
+                body += key.encode() + b'\x00' + value.encode() + b'\x00'
+        body += b'\x00'
+        self.writer.write(struct.pack('!i', len(body) + 4) + body)
+        await self.writer.drain()
+        while True:
+            code, data = await self._receive()
+            if code == b'R':
+                await self._authenticate(data)
+            elif code == b'E':
+                raise self._error(data)
+            elif code == b'Z':
+                break
+        self.log.debug('connected')
+        await self.query(
+            'set statement_timeout to {0}'.format(self.timeout * 1000))
+        self.log.debug('ready')
+
+    async def _authenticate(self, data):
+        method = struct.unpack('!i', data[:4])[0]
+        if method == 0:
+            self._scram = None
+            return
+        if self.passwd is None:
+            raise ProgrammingError('password is required')
+        if method == 3:
+            password = self.passwd.encode() + b'\x00'
+        elif method == 5:
+            salt = data[4:8]
+            inner = md5(
+                self.passwd.encode() + self.user.encode()).hexdigest()
+            password = b'md5' + md5(
+                inner.encode() + salt).hexdigest().encode() + b'\x00'
+        elif method == 10:
+            password = self._scram_first(data[4:])
+        elif method == 11:
+            password = self._scram_final(data[4:])
+        elif method == 12:
+            self._scram_verify(data[4:])
+            return
+        else:
+            self.log.error(
+                'unsupported authentication method {0}, use trust, '
+                'password, md5 or scram-sha-256'.format(method))
+            raise ProgrammingError(
+                'authentication method {0} is not supported'.format(method))
+        self._send(b'p', password)
+        await self.writer.drain()
+
+    # SASLInitialResponse with client-first-message, without
+    # channel binding
+    def _scram_first(self, data):
+        mechanisms = data.split(b'\x00')
+        if b'SCRAM-SHA-256' not in mechanisms:
+            self.log.error(
+                'unsupported SASL mechanisms: {0}'.format(b', '.join(
+                    x for x in mechanisms if x).decode()))
+            raise ProgrammingError('SASL mechanism is not supported')
+        nonce = base64.b64encode(os.urandom(18)).decode()
+        bare = 'n=,r={0}'.format(nonce)
+        self._scram = (bare, nonce)
+        message = ('n,,' + bare).encode()
+        return b'SCRAM-SHA-256\x00' + struct.pack(
+            '!i', len(message)) + message
+
+    # SASLResponse with client-final-message for server-first-message
+    def _scram_final(self, data):
+        bare, nonce = self._scram
+        server_first = data.decode()
+        fields = dict(x.split('=', 1) for x in server_first.split(','))
+        if not fields['r'].startswith(nonce):
+            raise ProgrammingError('SCRAM nonce mismatch')
+        salted = pbkdf2_hmac(
+            'sha256', self.passwd.encode(),
+            base64.b64decode(fields['s']), int(fields['i']))
+        without_proof = 'c=biws,r={0}'.format(fields['r'])
+        auth_message = ','.join(
+            [bare, server_first, without_proof]).encode()
+        client_key = hmac.new(salted, b'Client Key', sha256).digest()
+        signature = hmac.new(
+            sha256(client_key).digest(), auth_message, sha256).digest()
+        proof = bytes(x ^ y for x, y in zip(client_key, signature))
+        self._scram = (auth_message, salted)
+        return '{0},p={1}'.format(
+            without_proof, base64.b64encode(proof).decode()).encode()
+
+    # server-final-message: signature proves that server knows password
+    def _scram_verify(self, data):
+        auth_message, salted = self._scram
+        fields = dict(x.split('=', 1) for x in data.decode().split(','))
+        server_key = hmac.new(salted, b'Server Key', sha256).digest()
+        signature = hmac.new(server_key, auth_message, sha256).digest()
+        if 'v' not in fields or not hmac.compare_digest(
+                base64.b64decode(fields['v']), signature):
+            raise ProgrammingError('SCRAM server signature mismatch')
+
+    def _send(self, code, body):
+        self.writer.write(code + struct.pack('!i', len(body) + 4) + body)
+
+    async def _receive(self):
+        header = await self.reader.readexactly(5)
+        length = struct.unpack('!i', header[1:])[0]
+        return header[:1], await self.reader.readexactly(length - 4)
+
+    def _row_description(self, data):
+        count, idx, decoders = struct.unpack('!h', data[:2])[0], 2, []
+        for i in range(count):
+            idx = data.index(b'\x00', idx) + 1
+            oid = struct.unpack('!i', data[idx + 6:idx + 10])[0]
+            decoders.append(Decoders.get(oid))
+            idx += 18
+        return decoders
+
+    def _row(self, data, decoders):
+        count, idx, row = struct.unpack('!h', data[:2])[0], 2, []
+        for i in range(count):
+            length = struct.unpack('!i', data[idx:idx + 4])[0]
+            idx += 4
+            if length == -1:
+                row.append(None)
+                continue
+            value = data[idx:idx + length].decode(self.encoding)
+            idx += length
+            if decoders[i] is not None:
+                value = decoders[i](value)
+            row.append(value)
+        return row
+
+    def _error(self, data):
+        fields = {}
+        for field in data.split(b'\x00'):
+            if len(field) > 1:
+                fields[field[:1]] = field[1:].decode(self.encoding, 'replace')
+        return ProgrammingError(
+            fields.get(b'S'), fields.get(b'C'), fields.get(b'M'))
+
+
+class AsyncPool(ConnectionInfo):
+
+    """Connections by database for the event loop of scheduler,
+    up to pool_max queries to one database run at once."""
+
+    def __init__(self, info={}):
+        super(AsyncPool, self).__init__(info)
+        self.log = logging.getLogger('PGSQL-ASYNC')
+        self._idle, self._limits = {}, {}
+
+    async def query(self, query, db=None):
+        if db is None:
+            db = self.db
+        if db not in self._limits:
+            self._idle[db] = []
+            self._limits[db] = asyncio.Semaphore(self.pool_max)
+        async with self._limits[db]:
+            if len(self._idle[db]) > 0:
+                conn = self._idle[db].pop()
+            else:
+                info = dict(self.info)
+                info['db'] = db
+                conn = AsyncConnection(info)
+            try:
+                # statement_timeout is set too, this is for network
+                result = await asyncio.wait_for(
+                    conn.query(query), conn.timeout + 5)
+            except ProgrammingError:
+                # error of query, connection is ready for the next one
+                self._idle[db].append(conn)
+                raise
+            except Exception:
+                # state of the protocol is unknown
+                await conn.close()
+                raise
+            self._idle[db].append(conn)
+            return result
+
+    async def close(self):
+        for connections in self._idle.values():
+            while len(connections) > 0:
+                await connections.pop().close()
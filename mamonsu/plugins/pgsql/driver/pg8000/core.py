@@ -6,7 +6,7 @@ import threading
 from struct import pack
 from hashlib import md5
 from decimal import Decimal
-from collections import deque, defaultdict
+from collections import deque, defaultdict, OrderedDict
 from itertools import count, islice
 from .six.moves import map
 from .six import b, PY2, integer_types, next, PRE_26, text_type, u, binary_type
@@ -162,6 +162,7 @@ def pack_funcs(fmt):
     return struc.pack, struc.unpack_from
 
 i_pack, i_unpack = pack_funcs('i')
+I_pack, I_unpack = pack_funcs('I')
 h_pack, h_unpack = pack_funcs('h')
 q_pack, q_unpack = pack_funcs('q')
 d_pack, d_unpack = pack_funcs('d')
@@ -759,6 +760,39 @@ def float8_recv(data, offset, length):
     return d_unpack(data, offset)[0]
 
 
+def uint4_recv(data, offset, length):
+    return I_unpack(data, offset)[0]
+
+
+# struct codes of fixed-width types received in binary format
+FIXED_WIDTH = {
+    16: '?',  # bool
+    20: 'q',  # int8
+    21: 'h',  # int2
+    23: 'i',  # int4
+    26: 'I',  # oid
+    28: 'I',  # xid
+    700: 'f',  # float4
+    701: 'd',  # float8
+}
+
+
+def row_struct(row_desc, pg_types):
+    """Precompiled layout of DataRow message for rows of fixed-width
+    columns only, None if there are other columns. A row with NULLs is
+    shorter than the layout and is decoded column by column."""
+    if len(row_desc) == 0:
+        return None
+    # Int16 column count, then Int32 length and value of each column
+    fmt = ['!2x']
+    for field in row_desc:
+        code = FIXED_WIDTH.get(field['type_oid'])
+        if code is None or pg_types[field['type_oid']][0] != FC_BINARY:
+            return None
+        fmt.append('4x' + code)
+    return Struct(''.join(fmt))
+
+
 def bytea_send(v):
     return v
 
@@ -862,6 +896,8 @@ class Cursor():
         self._cached_rows = deque()
         self.portal_name = None
         self.portal_suspended = False
+        # rows fetched from portal at once, None for connection default
+        self.fetch_size = None
 
     @property
     def connection(self):
@@ -1238,6 +1274,10 @@ class Connection(object):
     _row_cache_size = 2000
     _row_cache_size_bin = i_pack(_row_cache_size)
 
+    # Number of prepared statements kept per paramstyle. When there are
+    # more, the least recently used one is closed on the server.
+    _ps_cache_size = 100
+
     def _getError(self, error):
         warn(
             "DB-API extension connection.%s used" %
@@ -1272,9 +1312,14 @@ class Connection(object):
 
         self.password = password
         self.autocommit = False
+        # size of messages received by handle_messages
+        self.bytes_received = 0
         self._xid = None
 
-        self._caches = defaultdict(lambda: defaultdict(dict))
+        self._caches = defaultdict(
+            lambda: {'statement': {}, 'ps': OrderedDict()})
+        # evicted prepared statements, closed with the next execute
+        self._ps_to_close = []
         self.statement_number = 0
         self.portal_number = 0
 
@@ -1499,8 +1544,8 @@ class Connection(object):
                 22: (FC_TEXT, vector_in),  # int2vector
                 23: (FC_BINARY, int4_recv),  # int4
                 25: (FC_BINARY, text_recv),  # TEXT type
-                26: (FC_TEXT, int_in),  # oid
-                28: (FC_TEXT, int_in),  # xid
+                26: (FC_BINARY, uint4_recv),  # oid
+                28: (FC_BINARY, uint4_recv),  # xid
                 114: (FC_TEXT, json_in),  # json
                 700: (FC_BINARY, float4_recv),  # float4
                 701: (FC_BINARY, float8_recv),  # float8
@@ -1942,7 +1987,8 @@ class Connection(object):
         key = tuple(oid for oid, x, y in params), operation
 
         try:
-            ps = cache['ps'][key]
+            # move to the end of LRU order
+            ps = cache['ps'][key] = cache['ps'].pop(key)
             cursor.ps = ps
         except KeyError:
             statement_name = "pg8000_statement_" + str(self.statement_number)
@@ -1951,6 +1997,7 @@ class Connection(object):
             ps = {
                 'row_desc': [],
                 'param_funcs': tuple(x[2] for x in params),
+                'statement_name_bin': statement_name_bin,
             }
             cursor.ps = ps
 
@@ -1997,6 +2044,7 @@ class Connection(object):
                 self.pg_types[f['type_oid']][0] for f in ps['row_desc'])
 
             ps['input_funcs'] = tuple(f['func'] for f in ps['row_desc'])
+            ps['row_struct'] = row_struct(ps['row_desc'], self.pg_types)
             # Byte1('B') - Identifies the Bind command.
             # Int32 - Message length, including self.
             # String - Name of the destination portal.
@@ -2021,14 +2069,20 @@ class Connection(object):
                 pack("!" + "h" * len(output_fc), *output_fc)
 
             cache['ps'][key] = ps
+            while len(cache['ps']) > self._ps_cache_size:
+                self._ps_to_close.append(cache['ps'].popitem(last=False)[1])
 
         cursor._cached_rows.clear()
         cursor._row_count = -1
         cursor.portal_name = "pg8000_portal_" + str(self.portal_number)
         self.portal_number += 1
         cursor.portal_name_bin = cursor.portal_name.encode('ascii') + NULL_BYTE
-        cursor.execute_msg = cursor.portal_name_bin + \
-            Connection._row_cache_size_bin
+        if cursor.fetch_size is None:
+            cursor.execute_msg = cursor.portal_name_bin + \
+                Connection._row_cache_size_bin
+        else:
+            cursor.execute_msg = cursor.portal_name_bin + \
+                i_pack(cursor.fetch_size)
 
         # Byte1('B') - Identifies the Bind command.
         # Int32 - Message length, including self.
@@ -2056,6 +2110,7 @@ class Connection(object):
             retval.extend(val)
         retval.extend(ps['bind_2'])
 
+        self.send_CLOSE_STATEMENTS()
         self._send_message(BIND, retval)
         self.send_EXECUTE(cursor)
         self._write(SYNC_MSG)
@@ -2068,7 +2123,8 @@ class Connection(object):
                     "rows than the pg8000 cache size, as the portal is closed "
                     "when the transaction is closed.")
 
-        else:
+        elif self.in_transaction:
+            # out of transaction the portal is already closed by Sync
             self.close_portal(cursor)
 
     def _send_message(self, code, data):
@@ -2110,6 +2166,7 @@ class Connection(object):
 
         if command in DDL_COMMANDS:
             for k in self._caches:
+                self._ps_to_close.extend(self._caches[k]['ps'].values())
                 self._caches[k]['ps'].clear()
 
     def handle_DATA_ROW(self, data, cursor):
@@ -2125,12 +2182,29 @@ class Connection(object):
                 data_idx += vlen
         cursor._cached_rows.append(row)
 
+    # DataRow of statement with row_struct: fixed-width columns
+    # without NULLs are unpacked at once, other rows by columns
+    def handle_DATA_ROW_struct(self, data, cursor):
+        layout = cursor.ps['row_struct']
+        if len(data) == layout.size:
+            cursor._cached_rows.append(list(layout.unpack(data)))
+        else:
+            self.handle_DATA_ROW(data, cursor)
+
     def handle_messages(self, cursor):
         code = self.error = None
+        # DataRow handler is chosen once per statement, rows of
+        # other statements are not checked for layout
+        ps = None if cursor is None else cursor.ps
+        if ps is not None and ps.get('row_struct') is not None:
+            self.message_types[DATA_ROW] = self.handle_DATA_ROW_struct
+        else:
+            self.message_types[DATA_ROW] = self.handle_DATA_ROW
 
         try:
             while code != READY_FOR_QUERY:
                 code, data_len = ci_unpack(self._read(5))
+                self.bytes_received += data_len + 1
                 self.message_types[code](self._read(data_len - 4), cursor)
         except:
             self._close()
@@ -2143,6 +2217,13 @@ class Connection(object):
     # Int32 - Message length, including self.
     # Byte1 - 'S' for prepared statement, 'P' for portal.
     # String - The name of the item to close.
+    def send_CLOSE_STATEMENTS(self):
+        # sent in front of the next Bind, CloseComplete responses
+        # are read with the results
+        while len(self._ps_to_close) > 0:
+            ps = self._ps_to_close.pop()
+            self._send_message(CLOSE, STATEMENT + ps['statement_name_bin'])
+
     def close_portal(self, cursor):
         self._send_message(CLOSE, PORTAL + cursor.portal_name_bin)
         self._write(SYNC_MSG)
@@ -1,12 +1,49 @@
+import time
+import threading
+
 import mamonsu.lib.platform as platform
 from distutils.version import LooseVersion
-from ._connection import Connection, ConnectionInfo
+from ._connection import ConnectionPool, ConnectionInfo
+from ._cache import Cache
+from ._stats import QueryStats
 
 
 class Pool(ConnectionInfo):
 
     ExcludeDBs = ['template0', 'template1', 'postgres']
 
+    # check connections for pool_idle every ReapInterval seconds
+    ReapInterval = 60
+
+    # one scan of pg_stat_activity for Connections, Oldest and Databases,
+    # the result is shared for activity_staleness seconds
+    ActivitySql = """select
+count(*),
+sum(case when state = 'active' then 1 else 0 end),
+sum(case when state = 'idle' then 1 else 0 end),
+sum(case when state = 'idle in transaction' then 1 else 0 end),
+{0},
+{1},
+extract(epoch from max(now() - xact_start)),
+sum(case when query like '%%autovacuum%%' and state <> 'idle'
+and pid <> pg_catalog.pg_backend_pid() then 1 else 0 end)
+from pg_catalog.pg_stat_activity"""
+    ActivityColumns = [
+        'total', 'active', 'idle', 'idle_in_transaction', 'waiting',
+        'xid_age', 'query_time', 'autovacuum']
+
+    # seconds to keep metadata in cache, values of a database are also
+    # dropped on reconnect and when recovery state changes
+    CacheTTL = {
+        'server_version': 3600,
+        'recovery': 30,
+        'bootstrap': 300,
+        'pgpro': 3600,
+        'pgproee': 3600,
+        'extension': 300,
+        'databases': 60,
+    }
+
     SQL = {
         # query type: ( 'if_not_installed', 'if_installed' )
         'replication_lag_master_query': (
@@ -38,16 +75,17 @@ from public.pg_buffercache""",
         ),
     }
 
-    def __init__(self):
-        super(Pool, self).__init__()
+    def __init__(self, info={}):
+        super(Pool, self).__init__(info)
         self.all_connections = {}
-        self._cache = {
-            'server_version': {'storage': {}},
-            'bootstrap': {'storage': {}, 'counter': 0, 'cache': 10},
-            'recovery': {'storage': {}, 'counter': 0, 'cache': 10},
-            'pgpro': {'storage': {}},
-            'pgproee': {'storage': {}}
-        }
+        # connections are created from plugins running in parallel
+        self._lock = threading.Lock()
+        self._reaped = time.time()
+        self.cache = Cache()
+        # per query stats, named as config section of instance
+        self.query_stats = QueryStats(self.info.get('name') or 'postgres')
+        # last known recovery state by database
+        self._recovery = {}
 
     def connection_string(self, db=None):
         self._init_connection(db)
@@ -57,19 +95,63 @@ from public.pg_buffercache""",
         if db is None:
             db = self.db
         self._init_connection(db)
+        self._reap()
         return self.all_connections[db].query(query)
 
+    # rows of query one by one, for big results
+    def query_iter(self, query, db=None, fetch_size=None):
+        if db is None:
+            db = self.db
+        self._init_connection(db)
+        self._reap()
+        return self.all_connections[db].query_iter(query, fetch_size)
+
+    # pg_stat_activity summary: {column from ActivityColumns: value}
+    def activity(self, db=None):
+
+        def fetch():
+            # waiting column is replaced by wait_event in 9.6
+            waiting = 'null'
+            if self.server_version_less('9.5.0', db):
+                waiting = 'sum(case when waiting then 1 else 0 end)'
+            # backend_xmin and backend_xid are added in 9.4
+            xid_age = 'null'
+            if not self.server_version_less('9.3.99', db):
+                xid_age = 'greatest(max(age(backend_xmin)), ' \
+                    'max(age(backend_xid)))'
+            row = self.query(
+                self.ActivitySql.format(waiting, xid_age), db)[0]
+            return dict(zip(self.ActivityColumns, row))
+
+        return self._cached(
+            'activity', db, fetch, ttl=self.activity_staleness)
+
+    # checkout stats summed over databases, max_wait is the max of them
+    def pool_stats(self):
+        result = {
+            'connections': 0, 'idle': 0, 'checkouts': 0,
+            'waits': 0, 'wait_time': 0, 'max_wait': 0}
+        with self._lock:
+            pools = list(self.all_connections.values())
+        for pool in pools:
+            for key, value in pool.take_stats().items():
+                if key == 'max_wait':
+                    result[key] = max(result[key], value)
+                else:
+                    result[key] += value
+        return result
+
     def server_version(self, db=None):
-        if db in self._cache['server_version']['storage']:
-            return self._cache['server_version']['storage'][db]
-        if platform.PY2:
-            result = self.query('show server_version', db)[0][0]
-        elif platform.PY3:
-            result = bytes(
-                self.query('show server_version', db)[0][0], 'utf-8')
-        self._cache['server_version']['storage'][db] = '{0}'.format(
-            result.decode('ascii'))
-        return self._cache['server_version']['storage'][db]
+
+        def fetch():
+            if platform.PY2:
+                result = self.query('show server_version', db)[0][0]
+            elif platform.PY3:
+                result = bytes(
+                    self.query('show server_version', db)[0][0], 'utf-8')
+            return '{0}'.format(result.decode('ascii'))
+
+        return self._cached('server_version', db, fetch)
 
     def server_version_greater(self, version, db=None):
         return self.server_version(db) >= LooseVersion(version)
@@ -78,64 +160,96 @@ from public.pg_buffercache""",
         return self.server_version(db) <= LooseVersion(version)
 
     def in_recovery(self, db=None):
-        if db in self._cache['recovery']['storage']:
-            if self._cache['recovery']['counter'] < self._cache['recovery']['cache']:
-                self._cache['recovery']['counter'] += 1
-                return self._cache['recovery']['storage'][db]
-        self._cache['recovery']['counter'] = 0
-        self._cache['recovery']['storage'][db] = self.query(
-            "select pg_catalog.pg_is_in_recovery()")[0][0]
-        return self._cache['recovery']['storage'][db]
+        if db is None:
+            db = self.db
+
+        def fetch():
+            result = self.query(
+                'select pg_catalog.pg_is_in_recovery()', db)[0][0]
+            # failover or switchover: metadata could be changed
+            last = self._recovery.get(db)
+            self._recovery[db] = result
+            if last is not None and last != result:
+                self.log.info('Recovery state is changed, reset cache')
+                self.cache.invalidate(db)
+            return result
+
+        return self._cached('recovery', db, fetch)
 
     def is_bootstraped(self, db=None):
-        if db in self._cache['bootstrap']['storage']:
-            if self._cache['bootstrap']['counter'] < self._cache['bootstrap']['cache']:
-                self._cache['bootstrap']['counter'] += 1
-                return self._cache['bootstrap']['storage'][db]
-        self._cache['bootstrap']['counter'] = 0
-        sql = """select count(*) from pg_catalog.pg_class
-            where relname = 'mamonsu_config'"""
-        result = int(self.query(sql, db)[0][0])
-        self._cache['bootstrap']['storage'][db] = (result == 1)
-        if self._cache['bootstrap']['storage'][db]:
-            self.all_connections[db].log.info('Found mamonsu bootstrap')
-        else:
-            self.all_connections[db].log.info('Can\'t found mamonsu bootstrap')
-            self.all_connections[db].log.info('hint: run `mamonsu bootstrap` if you want to run without superuser rights')
-        return self._cache['bootstrap']['storage'][db]
+        if db is None:
+            db = self.db
+
+        def fetch():
+            sql = """select count(*) from pg_catalog.pg_class
+                where relname = 'mamonsu_config'"""
+            result = (int(self.query(sql, db)[0][0]) == 1)
+            if result:
+                self.all_connections[db].log.info('Found mamonsu bootstrap')
+            else:
+                self.all_connections[db].log.info('Can\'t found mamonsu bootstrap')
+                self.all_connections[db].log.info('hint: run `mamonsu bootstrap` if you want to run without superuser rights')
+            return result
+
+        return self._cached('bootstrap', db, fetch)
 
     def is_pgpro(self, db=None):
-        if db in self._cache['pgpro']:
-            return self._cache['pgpro'][db]
-        try:
-            self.query('select pgpro_version()')
-            self._cache['pgpro'][db] = True
-        except:
-            self._cache['pgpro'][db] = False
-        return self._cache['pgpro'][db]
+
+        def fetch():
+            try:
+                self.query('select pgpro_version()', db)
+                return True
+            except:
+                return False
+
+        return self._cached('pgpro', db, fetch)
 
     def is_pgpro_ee(self, db=None):
         if not self.is_pgpro(db):
             return False
-        if db in self._cache['pgproee']:
-            return self._cache['pgproee'][db]
-        self._cache['pgproee'][db] = (
-            self.query('select pgpro_edition()')[0][0].lower() == 'enterprise'
-        )
-        return self._cache['pgproee'][db]
+
+        def fetch():
+            return self.query(
+                'select pgpro_edition()', db)[0][0].lower() == 'enterprise'
+
+        return self._cached('pgproee', db, fetch)
 
     def extension_installed(self, ext, db=None):
-        result = self.query('select count(*) from pg_catalog.pg_extension\
-            where extname = \'{0}\''.format(ext), db)
-        return (int(result[0][0])) == 1
+
+        def fetch():
+            result = self.query('select count(*) from pg_catalog.pg_extension\
+                where extname = \'{0}\''.format(ext), db)
+            return (int(result[0][0])) == 1
+
+        return self._cached('extension', db, fetch, ext)
 
     def databases(self):
-        result, databases = self.query('select datname from \
-            pg_catalog.pg_database'), []
-        for row in result:
-            if row[0] not in self.ExcludeDBs:
-                databases.append(row[0])
-        return databases
+
+        def fetch():
+            result, databases = self.query('select datname from \
+                pg_catalog.pg_database'), []
+            for row in result:
+                if row[0] not in self.ExcludeDBs:
+                    databases.append(row[0])
+            return databases
+
+        return list(self._cached('databases', None, fetch))
+
+    # metadata cache hits and misses summed over names
+    def cache_stats(self):
+        hits, misses = 0, 0
+        for name, value in self.cache.stats().items():
+            hits += value[0]
+            misses += value[1]
+        return hits, misses
+
+    def _cached(self, name, db, fetch, arg=None, ttl=None):
+        # the same key as in all_connections, see _on_reconnect
+        if db is None:
+            db = self.db
+        if ttl is None:
+            ttl = self.CacheTTL[name]
+        return self.cache.get(name, db, ttl, fetch, arg)
 
     def get_sql(self, typ, db=None):
         if typ not in self.SQL:
@@ -150,8 +264,27 @@ from public.pg_buffercache""",
         return self.query(self.get_sql(typ, db), db)
 
     def _init_connection(self, db):
-        if db not in self.all_connections:
-            # create new connection
-            info = self.info
-            info['db'] = db
-            self.all_connections[db] = Connection(info)
+        with self._lock:
+            if db not in self.all_connections:
+                # create new connection pool
+                info = dict(self.info)
+                info['db'] = db or self.db
+                info['on_reconnect'] = self._on_reconnect(db)
+                info['stats'] = self.query_stats
+                self.all_connections[db] = ConnectionPool(info)
+
+    def _on_reconnect(self, db):
+
+        def invalidate():
+            self.cache.invalidate(db)
+
+        return invalidate
+
+    def _reap(self):
+        with self._lock:
+            if time.time() - self._reaped < self.ReapInterval:
+                return
+            self._reaped = time.time()
+            pools = list(self.all_connections.values())
+        for pool in pools:
+            pool.reap()
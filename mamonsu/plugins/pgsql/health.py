@@ -1,29 +1,91 @@
 # -*- coding: utf-8 -*-
 
 from mamonsu.plugins.pgsql.plugin import PgsqlPlugin as Plugin
-from .pool import Pooler
+from mamonsu.plugins.pgsql.driver._stats import QueryStats
 import time
 
 
 class PgHealth(Plugin):
 
-    DEFAULT_CONFIG = {'uptime': str(60 * 10), 'cache': str(80)}
+    PerInstance = True
+
+    DEFAULT_CONFIG = {
+        'uptime': str(60 * 10), 'cache': str(80),
+        # fingerprints with the most run time discovered by
+        # mamonsu.query.discovery[] (11 items each), 0: only totals
+        'query_top': str(0)}
+
+    # counters of queries of mamonsu: (key, name, units)
+    QueryTotals = [
+        ('calls', 'calls', Plugin.UNITS.none),
+        ('errors', 'errors', Plugin.UNITS.none),
+        ('rows', 'rows', Plugin.UNITS.none),
+        ('bytes', 'bytes received', Plugin.UNITS.bytes),
+        ('time', 'total run time', Plugin.UNITS.s),
+    ]
 
     def run(self, zbx):
 
         start_time = time.time()
-        Pooler.query('select 1 as health')
+        self.pool.query('select 1 as health')
         zbx.send('pgsql.ping[]', (time.time() - start_time) * 100)
 
-        result = Pooler.query("select \
+        result = self.pool.query("select \
             date_part('epoch', now() - pg_postmaster_start_time())")
         zbx.send('pgsql.uptime[]', int(result[0][0]))
 
-        result = Pooler.query('select \
+        result = self.pool.query('select \
             round(sum(blks_hit)*100/sum(blks_hit+blks_read), 2) \
             from pg_catalog.pg_stat_database')
         zbx.send('pgsql.cache[hit]', int(result[0][0]))
 
+        stats = self.pool.pool_stats()
+        zbx.send('pgsql.pool[connections]', stats['connections'])
+        zbx.send('pgsql.pool[idle]', stats['idle'])
+        zbx.send(
+            'pgsql.pool[waits]', stats['waits'], Plugin.DELTA.simple_change)
+        zbx.send('pgsql.pool[max_wait]', stats['max_wait'])
+        hits, misses = self.pool.cache_stats()
+        zbx.send('pgsql.pool[cache_hits]', hits, Plugin.DELTA.simple_change)
+        zbx.send(
+            'pgsql.pool[cache_misses]', misses, Plugin.DELTA.simple_change)
+
+        # queries of mamonsu: totals and the top by fingerprint and database
+        all_stats = self.pool.query_stats.take_stats()
+        totals = dict((x[0], 0) for x in self.QueryTotals)
+        max_time = 0
+        for _, _, stats in all_stats:
+            for key in totals:
+                totals[key] += stats[key]
+            max_time = max(max_time, stats['max_time'])
+        metrics = [
+            ('mamonsu.queries[{0}]'.format(key), totals[key],
+                Plugin.DELTA.simple_change)
+            for key in totals]
+        metrics.append(('mamonsu.queries[max_time]', max_time))
+        top = int(self.plugin_config('query_top'))
+        if top <= 0:
+            zbx.send_many(metrics)
+            return
+        all_stats.sort(key=lambda x: x[2]['time'], reverse=True)
+        queries = []
+        for ident, db, stats in all_stats[:top]:
+            queries.append({'{#QUERY}': ident, '{#DATABASE}': db})
+            for name in ('calls', 'errors', 'rows', 'bytes', 'time'):
+                metrics.append((
+                    'mamonsu.query.{0}[{1},{2}]'.format(name, ident, db),
+                    stats[name], Plugin.DELTA.simple_change))
+            metrics.append((
+                'mamonsu.query.max_time[{0},{1}]'.format(ident, db),
+                stats['max_time']))
+            for bucket, count in stats['histogram']:
+                metrics.append((
+                    'mamonsu.query.runs[{0},{1},{2}]'.format(
+                        ident, db, bucket),
+                    count, Plugin.DELTA.simple_change))
+        zbx.send_many(metrics)
+        zbx.send('mamonsu.query.discovery[]', zbx.json({'data': queries}))
+
     def items(self, template):
         result = template.item({
             'name': 'PostgreSQL: ping',
@@ -40,6 +102,36 @@ class PgHealth(Plugin):
             'key': 'pgsql.cache[hit]',
             'value_type': Plugin.VALUE_TYPE.numeric_unsigned,
             'units': Plugin.UNITS.percent
+        }) + template.item({
+            'name': 'Mamonsu: connections to PostgreSQL',
+            'key': 'pgsql.pool[connections]'
+        }) + template.item({
+            'name': 'Mamonsu: idle connections to PostgreSQL',
+            'key': 'pgsql.pool[idle]'
+        }) + template.item({
+            'name': 'Mamonsu: queries waited for free connection',
+            'key': 'pgsql.pool[waits]'
+        }) + template.item({
+            'name': 'Mamonsu: max wait for free connection',
+            'key': 'pgsql.pool[max_wait]',
+            'units': Plugin.UNITS.s
+        }) + template.item({
+            'name': 'Mamonsu: metadata queries answered from cache',
+            'key': 'pgsql.pool[cache_hits]'
+        }) + template.item({
+            'name': 'Mamonsu: metadata queries sent to PostgreSQL',
+            'key': 'pgsql.pool[cache_misses]'
+        })
+        for key, name, units in self.QueryTotals:
+            result += template.item({
+                'name': 'Mamonsu queries: {0}'.format(name),
+                'key': 'mamonsu.queries[{0}]'.format(key),
+                'units': units
+            })
+        result += template.item({
+            'name': 'Mamonsu queries: max run time',
+            'key': 'mamonsu.queries[max_time]',
+            'units': Plugin.UNITS.s
         })
         return result
 
@@ -64,3 +156,51 @@ class PgHealth(Plugin):
             '()}&lt;' + str(self.plugin_config('cache'))
         })
         return result
+
+    def discovery_rules(self, template):
+        # see driver/_stats.py
+        rule = {
+            'name': 'Mamonsu queries discovery',
+            'key': 'mamonsu.query.discovery[]',
+            'filter': '{#QUERY}:.*'
+        }
+        name = 'Mamonsu query {#QUERY} in {#DATABASE}: '
+        items = [
+            {'key': 'mamonsu.query.calls[{#QUERY},{#DATABASE}]',
+                'name': name + 'calls'},
+            {'key': 'mamonsu.query.errors[{#QUERY},{#DATABASE}]',
+                'name': name + 'errors'},
+            {'key': 'mamonsu.query.rows[{#QUERY},{#DATABASE}]',
+                'name': name + 'rows'},
+            {'key': 'mamonsu.query.bytes[{#QUERY},{#DATABASE}]',
+                'name': name + 'bytes received',
+                'units': Plugin.UNITS.bytes},
+            {'key': 'mamonsu.query.time[{#QUERY},{#DATABASE}]',
+                'name': name + 'total run time',
+                'units': Plugin.UNITS.s},
+            {'key': 'mamonsu.query.max_time[{#QUERY},{#DATABASE}]',
+                'name': name + 'max run time',
+                'units': Plugin.UNITS.s}
+        ]
+        graphs = [{
+            'name': name + 'run time',
+            'items': [
+                {'color': 'CC0000',
+                    'key': 'mamonsu.query.max_time[{#QUERY},{#DATABASE}]'},
+                {'color': '0000CC',
+                    'key': 'mamonsu.query.time[{#QUERY},{#DATABASE}]'}]
+        }]
+        # run time histogram
+        colors = ['00CC00', '0000CC', 'CCCC00', 'CC00CC', 'CC0000']
+        histogram = []
+        for idx, bucket in enumerate(QueryStats.Buckets):
+            key = 'mamonsu.query.runs[{#QUERY},{#DATABASE},' + \
+                bucket[1] + ']'
+            items.append({
+                'key': key, 'name': name + 'runs up to ' + bucket[1]})
+            histogram.append({'key': key, 'color': colors[idx]})
+        graphs.append({
+            'name': name + 'run time histogram',
+            'type': self.GRAPH_TYPE.stacked,
+            'items': histogram})
+        return template.discovery_rule(rule=rule, items=items, graphs=graphs)
@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 
 from mamonsu.plugins.pgsql.plugin import PgsqlPlugin as Plugin
-from .pool import Pooler
 
 
 class Instance(Plugin):
 
+    PerInstance = True
+
     Items = [
         # key, zbx_key, description,
         #    ('graph name', color, side), units, delta
@@ -57,7 +58,7 @@ class Instance(Plugin):
 
     def run(self, zbx):
         params = ['sum({0}) as {0}'.format(x[0]) for x in self.Items]
-        result = Pooler.query('select {0} from \
+        result = self.pool.query('select {0} from \
             pg_catalog.pg_stat_database'.format(
             ', '.join(params)))
         for idx, val in enumerate(result[0]):
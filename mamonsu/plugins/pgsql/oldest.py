@@ -1,22 +1,11 @@
 # -*- coding: utf-8 -*-
 
 from mamonsu.plugins.pgsql.plugin import PgsqlPlugin as Plugin
-from .pool import Pooler
 
 
 class Oldest(Plugin):
 
-    OldestXidSql = """
-select
-    greatest(max(age(backend_xmin)), max(age(backend_xid)))
-from pg_catalog.pg_stat_activity;
-"""
-
-    OldestQuerySql = """
-select
-    extract(epoch from max(now() - xact_start))
-from pg_catalog.pg_stat_activity;
-"""
+    PerInstance = True
 
     DEFAULT_CONFIG = {
         'max_xid_age': str(5000 * 60 * 60),
@@ -24,10 +13,11 @@ from pg_catalog.pg_stat_activity;
     }
 
     def run(self, zbx):
-        xid = Pooler.query(self.OldestXidSql)[0][0]
-        zbx.send('pgsql.oldest[xid_age]', xid)
-        query = Pooler.query(self.OldestQuerySql)[0][0]
-        zbx.send('pgsql.oldest[query_time]', query)
+        activity = self.pool.activity()
+        # null before 9.4
+        if activity['xid_age'] is not None:
+            zbx.send('pgsql.oldest[xid_age]', activity['xid_age'])
+        zbx.send('pgsql.oldest[query_time]', activity['query_time'])
 
     def graphs(self, template):
         result = template.graph({
@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 
 from mamonsu.plugins.pgsql.plugin import PgsqlPlugin as Plugin
-from .pool import Pooler
 
 
 class PgBufferCache(Plugin):
 
+    PerInstance = True
+
     Items = [
         # key, name, color
         ('size', 'PostgreSQL: shared buffer size', '0000CC'),
@@ -16,7 +17,7 @@ class PgBufferCache(Plugin):
     def run(self, zbx):
         if not self.extension_installed('pg_buffercache'):
             return
-        result = Pooler.run_sql_type('buffer_cache')[0]
+        result = self.pool.run_sql_type('buffer_cache')[0]
         for i, value in enumerate(result):
             zbx.send('pgsql.buffers[{0}]'.format(self.Items[i][0]), value)
 
@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 
 from mamonsu.plugins.pgsql.plugin import PgsqlPlugin as Plugin
-from .pool import Pooler
 
 
 class PgLocks(Plugin):
 
+    PerInstance = True
+
     Items = [
         # key, desc, color
         ('accessshare',
@@ -36,7 +37,7 @@ class PgLocks(Plugin):
     ]
 
     def run(self, zbx):
-        result = Pooler.query("""
+        result = self.pool.query("""
             select lower(mode), count(mode) FROM pg_catalog.pg_locks group by 1
             """)
         for item in self.Items:
@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 
 from mamonsu.plugins.pgsql.plugin import PgsqlPlugin as Plugin
-from .pool import Pooler
 
 
 class PgStatStatement(Plugin):
 
+    PerInstance = True
+
     # zbx_key, sql, desc, unit, delta, (Graph, color, side)
     Items = [
 
@@ -42,7 +43,7 @@ class PgStatStatement(Plugin):
         if not self.extension_installed('pg_stat_statements'):
             return
         params = [x[1] for x in self.Items]
-        result = Pooler.query('\
+        result = self.pool.query('\
             select {0} from public.pg_stat_statements'.format(
             ', '.join(params)))
         for idx, val in enumerate(result[0]):
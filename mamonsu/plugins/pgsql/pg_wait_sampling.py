@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 
 from mamonsu.plugins.pgsql.plugin import PgsqlPlugin as Plugin
-from .pool import Pooler
 
 
 class PgWaitSampling(Plugin):
 
+    PerInstance = True
+
     AllLockItems = [
         # (sql_key, zbx_key, name, color)
         ('lwlock', 'all_lock[lwlock]',
@@ -119,9 +120,9 @@ order by count desc"""
 
         self.disable_and_exit_if_extension_is_not_installed('pg_wait_sampling')
 
-        find_and_send(Pooler.query(self.AllLockQuery), self.AllLockItems, zbx)
-        find_and_send(Pooler.query(self.HWLockQuery), self.HWLockItems, zbx)
-        find_and_send(Pooler.query(self.LWLockQuery), self.LWLockItems, zbx)
+        find_and_send(self.pool.query(self.AllLockQuery), self.AllLockItems, zbx)
+        find_and_send(self.pool.query(self.HWLockQuery), self.HWLockItems, zbx)
+        find_and_send(self.pool.query(self.LWLockQuery), self.LWLockItems, zbx)
 
     def items(self, template):
         result = ''
@@ -1,48 +1,76 @@
+import logging
+
 from mamonsu.lib.plugin import Plugin, PluginDisableException
+from mamonsu.lib.sender import HostSender
+import mamonsu.lib.platform as platform
 from .pool import Pooler
 
+if platform.ASYNC:
+    from .pool import AsyncPooler
+
 
 class PgsqlPlugin(Plugin):
 
     is_child = False
+    # copy plugin for each [postgres:NAME] instance, only for plugins
+    # which query through self.pool (and self.async_pool)
+    PerInstance = False
 
     def __init__(self, config):
         super(PgsqlPlugin, self).__init__(config)
         self._enabled = config.fetch('postgres', 'enabled', bool)
-        self._ext_installed, self._ext_check_count = False, None
+        self._ext_installed = None
+        # main instance from [postgres], see set_instance
+        self.pool = Pooler
+        if platform.ASYNC:
+            self.async_pool = AsyncPooler
+        self.host = None
 
     @classmethod
     def only_child_subclasses(self):
         # return all childs
         return self.__subclasses__()
 
-    def extension_installed(self, ext, db=None, silent=False):
+    # bind plugin to PostgreSQL instance from [postgres:NAME],
+    # metrics are sent for zabbix host `host`
+    def set_instance(self, name, pool, host, async_pool=None):
+        self.instance = name
+        self.pool = pool
+        if async_pool is not None:
+            self.async_pool = async_pool
+        self.host = host
+        self.log = logging.getLogger('{0}:{1}'.format(
+            self.__class__.__name__.upper(), name))
 
-        def check(self, ext):
-            self._ext_installed = Pooler.extension_installed(ext, db)
-            self._ext_check_count = 0
-            if not self._ext_installed and not silent:
-                self.log.info("Extension '{0}' is not installed".format(ext))
+    # all plugins of PostgreSQL instance block if it does not answer
+    def worker_group(self):
+        if self.instance is None:
+            return 'postgres'
+        return 'postgres:{0}'.format(self.instance)
 
-        if self._ext_check_count is None:
-            # first check
-            check(self, ext)
-        elif self._ext_check_count > 5:
-            # try to RE-check
-            check(self, ext)
-        self._ext_check_count += 1
+    def set_sender(self, sender):
+        if self.host is not None:
+            sender = HostSender(sender, self.host)
+        super(PgsqlPlugin, self).set_sender(sender)
 
-        return self._ext_installed
+    def extension_installed(self, ext, db=None, silent=False):
+        # result is cached by pool, log only changes
+        installed = self.pool.extension_installed(ext, db)
+        if not installed and not silent and \
+                self._ext_installed is not False:
+            self.log.info("Extension '{0}' is not installed".format(ext))
+        self._ext_installed = installed
+        return installed
 
     def disable_and_exit_if_extension_is_not_installed(self, ext, db=None):
         if not self.extension_installed(ext, db=db, silent=True):
             self.disable()
             raise PluginDisableException("""Disable plugin and exit, because '{0}' \
 extension is not installed. Enable it in PostgreSQL instance: '{1}', \
-if needed and restart.""".format(ext, Pooler.connection_string(db)))
+if needed and restart.""".format(ext, self.pool.connection_string(db)))
 
     def disable_and_exit_if_not_pgpro_ee(self, db=None):
-        if not Pooler.is_pgpro_ee(db):
+        if not self.pool.is_pgpro_ee(db):
             raise PluginDisableException("""Disable plugin and exit, because \
 PostgresPro Enterprise Edition is not detected [instance: '{0}']
-""".format(Pooler.connection_string(db)))
+""".format(self.pool.connection_string(db)))
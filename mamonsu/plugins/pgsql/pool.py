@@ -1,4 +1,10 @@
 # -*- coding: utf-8 -*-
 
+import mamonsu.lib.platform as platform
 from mamonsu.plugins.pgsql.driver.pool import Pool
 Pooler = Pool()  # create connection with environment var
+
+if platform.ASYNC:
+    # for plugins with `async def run`
+    from mamonsu.plugins.pgsql.driver.aio import AsyncPool
+    AsyncPooler = AsyncPool()
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+
+import os
+import errno
+
+import mamonsu.lib.platform as platform
+from mamonsu.plugins.pgsql.plugin import PgsqlPlugin as Plugin
+
+if platform.LINUX:
+    import resource
+    from mamonsu.plugins.system.linux import procfs
+
+
+class BackendProcesses(Plugin):
+
+    """CPU, memory, io and context switches of PostgreSQL processes from
+    /proc/<pid>, summed by backend type. Pids are taken from
+    pg_stat_activity, only children of postmaster of the monitored
+    server are counted, so remote servers are skipped."""
+
+    PerInstance = True
+
+    # (group, name, color)
+    Groups = [
+        ('client', 'client backends', '0000CC'),
+        ('autovacuum', 'autovacuum', '00CC00'),
+        ('checkpointer', 'checkpointer', 'CC0000'),
+        ('bgwriter', 'background writer', 'CCCC00'),
+        ('walwriter', 'wal writer', 'CC00CC'),
+        ('replication', 'replication', '00CCCC'),
+        ('bgworker', 'background workers', '777777'),
+        ('other', 'other processes', '000077'),
+    ]
+
+    # backend_type of pg_stat_activity: group, the rest are 'other'
+    BackendTypes = {
+        'client backend': 'client',
+        'autovacuum launcher': 'autovacuum',
+        'autovacuum worker': 'autovacuum',
+        'checkpointer': 'checkpointer',
+        'background writer': 'bgwriter',
+        'walwriter': 'walwriter',
+        'walsender': 'replication',
+        'walreceiver': 'replication',
+        'startup': 'replication',
+        'background worker': 'bgworker',
+        'parallel worker': 'bgworker',
+        'logical replication launcher': 'bgworker',
+        'logical replication worker': 'bgworker',
+    }
+
+    # (key, name, delta, units)
+    Items = [
+        ('count', 'number of processes', None, Plugin.UNITS.none),
+        ('cpu', 'cpu usage', Plugin.DELTA_SPEED, Plugin.UNITS.percent),
+        ('rss', 'resident memory (with shared)',
+            None, Plugin.UNITS.bytes),
+        ('rss_anon', 'resident private memory', None, Plugin.UNITS.bytes),
+        ('read_bytes', 'read bytes/s', Plugin.DELTA_SPEED,
+            Plugin.UNITS.bytes),
+        ('write_bytes', 'write bytes/s', Plugin.DELTA_SPEED,
+            Plugin.UNITS.bytes),
+        ('voluntary_ctxt', 'voluntary context switches/s',
+            Plugin.DELTA_SPEED, Plugin.UNITS.none),
+        ('involuntary_ctxt', 'involuntary context switches/s',
+            Plugin.DELTA_SPEED, Plugin.UNITS.none),
+    ]
+
+    # cumulative counters of process, summed over lifetime of group
+    Counters = [
+        'cpu', 'read_bytes', 'write_bytes',
+        'voluntary_ctxt', 'involuntary_ctxt']
+
+    # backend_type is in pg_stat_activity since 10, before only
+    # client backends and autovacuum workers are listed
+    Query = """select pid, backend_type, pid = pg_catalog.pg_backend_pid()
+from pg_catalog.pg_stat_activity"""
+    QueryOld = """select pid,
+case when query like 'autovacuum:%%' then 'autovacuum worker'
+else 'client backend' end,
+pid = pg_catalog.pg_backend_pid()
+from pg_catalog.pg_stat_activity"""
+
+    # lines of /proc/<pid>/status and /proc/<pid>/io: (key, multiplier)
+    StatusFields = {
+        'VmRSS:': ('rss', 1024),
+        'RssAnon:': ('rss_anon', 1024),
+        'voluntary_ctxt_switches:': ('voluntary_ctxt', 1),
+        'nonvoluntary_ctxt_switches:': ('involuntary_ctxt', 1),
+    }
+    IoFields = {
+        'read_bytes:': ('read_bytes', 1),
+        'write_bytes:': ('write_bytes', 1),
+    }
+
+    # files of process kept open between runs: (name, buffer size),
+    # buffers grow if a file is bigger
+    ProcFiles = [('stat', 512), ('status', 2048), ('io', 256)]
+    # descriptors are kept for up to so many processes (3 for each),
+    # but not more than a quarter of limit of open files, files
+    # of others are opened for each read
+    KeepOpen = 2000
+
+    def __init__(self, config):
+        super(BackendProcesses, self).__init__(config)
+        if not platform.LINUX:
+            self.disable()
+            return
+        self.ticks = os.sysconf('SC_CLK_TCK')
+        # pid: (start time, {counter: value}) of the last scan
+        self._procs = {}
+        # time of the last scan in ticks since boot
+        self._scanned = None
+        # {group: {counter: sum of increments}}
+        self._totals = dict((x[0], dict.fromkeys(
+            self.Counters, 0)) for x in self.Groups)
+        # /proc/<pid>/io is readable only by owner of processes
+        self._io = True
+        self._io_keys = [x[0] for x in self.IoFields.values()]
+        self._local = None
+        # pid: {name: procfs.ProcFile} of processes of the last scan
+        self._files = {}
+        limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+        self._keep_open = self.KeepOpen
+        if limit != resource.RLIM_INFINITY:
+            self._keep_open = min(
+                self.KeepOpen, limit // 4 // len(self.ProcFiles))
+
+    def run(self, zbx):
+        if self.pool.server_version_less('9.6.99'):
+            rows = self.pool.query(self.QueryOld)
+        else:
+            rows = self.pool.query(self.Query)
+        now = self._uptime_ticks()
+        postmaster = self._postmaster(rows)
+        if postmaster is None:
+            self._procs, self._scanned = {}, None
+            for pid in list(self._files):
+                self._close(pid)
+            return
+
+        gauges = dict((x[0], {'count': 0, 'rss': 0, 'rss_anon': 0})
+                      for x in self.Groups)
+        procs = {}
+        for pid, backend_type, _ in rows:
+            proc = self._read(pid, postmaster)
+            if proc is None:
+                continue
+            start, values = proc
+            group = self.BackendTypes.get(backend_type, 'other')
+            gauges[group]['count'] += 1
+            gauges[group]['rss'] += values.get('rss', 0)
+            gauges[group]['rss_anon'] += values.get('rss_anon', 0)
+            last = self._procs.get(pid)
+            if last is not None and last[0] == start:
+                # the same process as in the last scan
+                base = last[1]
+            elif self._scanned is not None and start >= self._scanned:
+                # started after the last scan, all usage is new
+                base = {}
+            else:
+                # first scan: only the next increments are counted
+                base = values
+            totals = self._totals[group]
+            for key in self.Counters:
+                if key in values:
+                    totals[key] += values[key] - base.get(key, 0)
+            procs[pid] = proc
+        # exited processes are forgotten, their usage since the last
+        # scan is lost
+        self._procs, self._scanned = procs, now
+        for pid in [x for x in self._files if x not in procs]:
+            self._close(pid)
+
+        metrics = []
+        for group, _, _ in self.Groups:
+            totals = self._totals[group]
+            for key, _, delta, _ in self.Items:
+                if key in self.Counters:
+                    value = totals[key]
+                    if key == 'cpu':
+                        value = value * 100.0 / self.ticks
+                    elif not self._io and key in self._io_keys:
+                        continue
+                else:
+                    value = gauges[group][key]
+                metrics.append((
+                    'pgsql.backend.{0}[{1}]'.format(key, group), value, delta))
+        zbx.send_many(metrics)
+
+    # pid of postmaster: parent of our own backend, forked from the
+    # same executable, None if server is not on this host
+    def _postmaster(self, rows):
+        result = None
+        for pid, _, own in rows:
+            if not own:
+                continue
+            try:
+                comm, ppid = self._comm_and_parent(pid)
+                if ppid > 1 and self._comm_and_parent(ppid)[0] == comm:
+                    result = ppid
+            except (IOError, OSError, ValueError):
+                result = None
+        if (result is not None) != self._local:
+            self._local = result is not None
+            if not self._local:
+                self.log.info(
+                    'PostgreSQL is not running on this host, '
+                    'processes are not monitored')
+        return result
+
+    # (start time, {key: value}) of child of postmaster, None if
+    # process is exited or is not of this server
+    def _read(self, pid, postmaster):
+        values = {}
+        try:
+            try:
+                stat = self._read_file(pid, 'stat')
+            except (IOError, OSError) as e:
+                # descriptor of exited process fails with ESRCH even if
+                # pid is reused, files of the new one are opened again
+                if e.errno != errno.ESRCH or pid not in self._files:
+                    raise
+                self._close(pid)
+                stat = self._read_file(pid, 'stat')
+            # comm in parentheses could contain spaces
+            fields = stat[stat.rindex(')') + 2:].split()
+            if int(fields[1]) != postmaster:
+                self._close(pid)
+                return None
+            # utime, stime, starttime
+            values['cpu'] = int(fields[11]) + int(fields[12])
+            start = int(fields[19])
+            self._parse(
+                self._read_file(pid, 'status'), self.StatusFields, values)
+            if self._io:
+                values.update(self._read_io(pid))
+        except (IOError, OSError, ValueError, IndexError) as e:
+            self.log.debug('read process {0}: {1}'.format(pid, e))
+            self._close(pid)
+            return None
+        return start, values
+
+    # content of /proc/<pid>/<name>, descriptors are kept open
+    # (and read from offset 0) while the process lives
+    def _read_file(self, pid, name):
+        files = self._files.get(pid)
+        if files is None:
+            if len(self._files) >= self._keep_open:
+                return procfs.read_once('/proc/{0}/{1}'.format(pid, name))
+            files = self._files[pid] = dict(
+                (x, procfs.ProcFile('/proc/{0}/{1}'.format(pid, x), size))
+                for x, size in self.ProcFiles)
+        return files[name].read()
+
+    def _close(self, pid):
+        files = self._files.pop(pid, None)
+        if files is not None:
+            for proc_file in files.values():
+                proc_file.close()
+
+    def _read_io(self, pid):
+        result = {}
+        try:
+            data = self._read_file(pid, 'io')
+        except (IOError, OSError) as e:
+            if e.errno not in (errno.EACCES, errno.EPERM):
+                raise
+            self._io = False
+            self.log.info(
+                'Disable io of processes, no access to /proc/<pid>/io: '
+                'run mamonsu as owner of PostgreSQL processes '
+                'for io metrics')
+            return result
+        self._parse(data, self.IoFields, result)
+        return result
+
+    # values of 'name: value' lines of status or io, lines are found
+    # by name, not split all (status is of about 50 lines)
+    def _parse(self, data, fields, values):
+        for name, field in fields.items():
+            start = data.find('\n' + name) + 1
+            if start == 0:
+                continue
+            end = data.find('\n', start)
+            values[field[0]] = int(
+                data[start + len(name):end].split()[0]) * field[1]
+
+    def _comm_and_parent(self, pid):
+        stat = procfs.read_once('/proc/{0}/stat'.format(pid))
+        return (
+            stat[stat.index('(') + 1:stat.rindex(')')],
+            int(stat[stat.rindex(')') + 2:].split()[1]))
+
+    def _uptime_ticks(self):
+        return int(float(procfs.read(
+            '/proc/uptime').split()[0]) * self.ticks)
+
+    def items(self, template):
+        result = ''
+        for group, group_name, _ in self.Groups:
+            for key, name, _, units in self.Items:
+                result += template.item({
+                    'name': 'PostgreSQL processes {0}: {1}'.format(
+                        group_name, name),
+                    'key': 'pgsql.backend.{0}[{1}]'.format(key, group),
+                    'units': units
+                })
+        return result
+
+    def graphs(self, template):
+        result = ''
+        for key, name in [
+                ('cpu', 'cpu usage'),
+                ('rss_anon', 'private memory'),
+                ('read_bytes', 'read bytes/s'),
+                ('write_bytes', 'write bytes/s')]:
+            items = []
+            for group, _, color in self.Groups:
+                items.append({
+                    'key': 'pgsql.backend.{0}[{1}]'.format(key, group),
+                    'color': color
+                })
+            result += template.graph({
+                'name': 'PostgreSQL processes: {0}'.format(name),
+                'items': items, 'type': self.GRAPH_TYPE.stacked})
+        return result
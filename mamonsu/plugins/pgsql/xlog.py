@@ -1,29 +1,30 @@
 # -*- coding: utf-8 -*-
 
 from mamonsu.plugins.pgsql.plugin import PgsqlPlugin as Plugin
-from .pool import Pooler
 
 
 class Xlog(Plugin):
 
+    PerInstance = True
+
     DEFAULT_CONFIG = {'lag_more_then_in_sec': str(60 * 5)}
 
     def run(self, zbx):
-        if Pooler.in_recovery():
+        if self.pool.in_recovery():
             # replication lag
-            lag = Pooler.run_sql_type('replication_lag_slave_query')
+            lag = self.pool.run_sql_type('replication_lag_slave_query')
             if lag[0][0] is not None:
                 zbx.send('pgsql.replication_lag[sec]', float(lag[0][0]))
         else:
-            Pooler.run_sql_type('replication_lag_master_query')
+            self.pool.run_sql_type('replication_lag_master_query')
             # xlog location
-            result = Pooler.query("""
+            result = self.pool.query("""
                 select pg_catalog.pg_xlog_location_diff
                     (pg_catalog.pg_current_xlog_location(),'0/00000000')""")
             zbx.send(
                 'pgsql.wal.write[]', float(result[0][0]), self.DELTA_SPEED)
         # count of xlog files
-        result = Pooler.run_sql_type('count_xlog_files')
+        result = self.pool.run_sql_type('count_xlog_files')
         zbx.send('pgsql.wal.count[]', int(result[0][0]))
 
     def items(self, template):
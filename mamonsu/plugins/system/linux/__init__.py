@@ -1,6 +1,7 @@
 __all__ = [
     'proc_stat', 'disk_stats', 'disk_sizes',
-    'memory', 'uptime', 'open_files', 'net', 'la'
+    'memory', 'uptime', 'open_files', 'net', 'la',
+    'pressure'
 ]
 
 from . import *
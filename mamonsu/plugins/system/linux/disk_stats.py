@@ -1,5 +1,7 @@
+import os
 import re
 from mamonsu.plugins.system.plugin import SystemPlugin as Plugin
+from mamonsu.plugins.system.linux import procfs
 
 
 class DiskStats(Plugin):
@@ -10,42 +12,85 @@ class DiskStats(Plugin):
     # Track only physical devices without logical partitions
     OnlyPhysicalDevices = True
 
-    re_stat = re.compile('^(?:\s+\d+){2}\s+([\w\d]+) (.*)$')
+    Path = '/proc/diskstats'
+    SectorSize = 512
+
+    re_skip = re.compile('ram|loop')
+    # partitions, if /sys/block is not available
+    re_partition = re.compile('\d+$')
+
+    # fields after major, minor and device name:
     # rd_ios rd_merges rd_sectors rd_ticks
     # wr_ios wr_merges wr_sectors wr_ticks
     # ios_in_prog tot_ticks rq_ticks
+    # since linux 4.18: dc_ios dc_merges dc_sectors dc_ticks
+    # (key, field index, multiplier, delta)
+    Fields = [
+        ('read', 0, 1, Plugin.DELTA_SPEED),
+        ('read_merges', 1, 1, Plugin.DELTA_SPEED),
+        ('read_bytes', 2, SectorSize, Plugin.DELTA_SPEED),
+        ('read_time', 3, 1, Plugin.DELTA_SPEED),
+        ('write', 4, 1, Plugin.DELTA_SPEED),
+        ('write_merges', 5, 1, Plugin.DELTA_SPEED),
+        ('write_bytes', 6, SectorSize, Plugin.DELTA_SPEED),
+        ('write_time', 7, 1, Plugin.DELTA_SPEED),
+        ('in_flight', 8, 1, None),
+        ('queue_time', 10, 1, Plugin.DELTA_SPEED),
+        ('discard', 11, 1, Plugin.DELTA_SPEED),
+        ('discard_merges', 12, 1, Plugin.DELTA_SPEED),
+        ('discard_bytes', 13, SectorSize, Plugin.DELTA_SPEED),
+        ('discard_time', 14, 1, Plugin.DELTA_SPEED),
+    ]
+
+    def __init__(self, config):
+        super(DiskStats, self).__init__(config)
+        # device names of the last read and tracked ones of them
+        self._names, self._tracked = None, set()
 
     def run(self, zbx):
-        with open('/proc/diskstats', 'r') as f:
-
-            devices = []
-            all_read, all_write = 0, 0
-
-            for line in f:
-                if re.search('(ram|loop)', line):
-                    continue
-                m = self.re_stat.match(line)
-                if m is None:
-                    continue
-                dev, val = m.group(1), m.group(2)
-                if self.OnlyPhysicalDevices and re.search('\d+$', dev):
-                    continue
-                val = [int(x) for x in val.split()]
-                read, write, ticks = val[0], val[4], val[9]
-                all_read += read
-                all_write += write
-                devices.append({'{#BLOCKDEVICE}': dev})
-
-                zbx.send('system.disk.read[{0}]'.format(
-                    dev), read, self.DELTA_SPEED)
-                zbx.send('system.disk.write[{0}]'.format(
-                    dev), write, self.DELTA_SPEED)
-                zbx.send('system.disk.utilization[{0}]'.format(
-                    dev), ticks / 10, self.DELTA_SPEED)
-
-            zbx.send('system.disk.all_read[]', all_read, self.DELTA_SPEED)
-            zbx.send('system.disk.all_write[]', all_write, self.DELTA_SPEED)
-            zbx.send('system.disk.discovery[]', zbx.json({'data': devices}))
+        lines = [
+            line for line in procfs.read(self.Path).splitlines() if line]
+        names = [line.split(None, 3)[2] for line in lines]
+        if names != self._names:
+            self._names = names
+            self._tracked = set(x for x in names if self._is_tracked(x))
+            self.log.debug('tracked devices: {0}'.format(
+                ', '.join(sorted(self._tracked))))
+
+        devices, metrics = [], []
+        all_read, all_write = 0, 0
+        for line, dev in zip(lines, names):
+            if dev not in self._tracked:
+                continue
+            val = [int(x) for x in line.split()[3:]]
+            all_read += val[0]
+            all_write += val[4]
+            devices.append({'{#BLOCKDEVICE}': dev})
+            for key, idx, multiplier, delta in self.Fields:
+                # fields of newer kernels
+                if idx >= len(val):
+                    break
+                metrics.append(('system.disk.{0}[{1}]'.format(
+                    key, dev), val[idx] * multiplier, delta))
+            metrics.append(('system.disk.utilization[{0}]'.format(
+                dev), val[9] / 10, self.DELTA_SPEED))
+
+        metrics.append(('system.disk.all_read[]', all_read, self.DELTA_SPEED))
+        metrics.append(('system.disk.all_write[]', all_write, self.DELTA_SPEED))
+        zbx.send_many(metrics)
+        zbx.send('system.disk.discovery[]', zbx.json({'data': devices}))
+
+    def _is_tracked(self, dev):
+        if self.re_skip.search(dev) is not None:
+            return False
+        if not self.OnlyPhysicalDevices:
+            return True
+        if os.path.isdir('/sys/block'):
+            # whole disks backed by hardware: not partitions and
+            # not dm, md and other virtual devices
+            return os.path.exists(os.path.join(
+                '/sys/block', dev.replace('/', '!'), 'device'))
+        return self.re_partition.search(dev) is None
 
     def items(self, template):
         return template.item({
@@ -84,7 +129,50 @@ class DiskStats(Plugin):
                 'name': 'Block device {#BLOCKDEVICE}: read operations'},
             {
                 'key': 'system.disk.write[{#BLOCKDEVICE}]',
-                'name': 'Block device {#BLOCKDEVICE}: write operations'}]
+                'name': 'Block device {#BLOCKDEVICE}: write operations'},
+            {
+                'key': 'system.disk.read_merges[{#BLOCKDEVICE}]',
+                'name': 'Block device {#BLOCKDEVICE}: read merges'},
+            {
+                'key': 'system.disk.write_merges[{#BLOCKDEVICE}]',
+                'name': 'Block device {#BLOCKDEVICE}: write merges'},
+            {
+                'key': 'system.disk.read_bytes[{#BLOCKDEVICE}]',
+                'name': 'Block device {#BLOCKDEVICE}: read bytes',
+                'units': Plugin.UNITS.bytes},
+            {
+                'key': 'system.disk.write_bytes[{#BLOCKDEVICE}]',
+                'name': 'Block device {#BLOCKDEVICE}: write bytes',
+                'units': Plugin.UNITS.bytes},
+            {
+                'key': 'system.disk.read_time[{#BLOCKDEVICE}]',
+                'name': 'Block device {#BLOCKDEVICE}: time spent reading',
+                'units': Plugin.UNITS.ms},
+            {
+                'key': 'system.disk.write_time[{#BLOCKDEVICE}]',
+                'name': 'Block device {#BLOCKDEVICE}: time spent writing',
+                'units': Plugin.UNITS.ms},
+            {
+                'key': 'system.disk.in_flight[{#BLOCKDEVICE}]',
+                'name': 'Block device {#BLOCKDEVICE}: requests in flight'},
+            {
+                'key': 'system.disk.queue_time[{#BLOCKDEVICE}]',
+                'name': 'Block device {#BLOCKDEVICE}: weighted time in queue',
+                'units': Plugin.UNITS.ms},
+            {
+                'key': 'system.disk.discard[{#BLOCKDEVICE}]',
+                'name': 'Block device {#BLOCKDEVICE}: discard operations'},
+            {
+                'key': 'system.disk.discard_merges[{#BLOCKDEVICE}]',
+                'name': 'Block device {#BLOCKDEVICE}: discard merges'},
+            {
+                'key': 'system.disk.discard_bytes[{#BLOCKDEVICE}]',
+                'name': 'Block device {#BLOCKDEVICE}: discarded bytes',
+                'units': Plugin.UNITS.bytes},
+            {
+                'key': 'system.disk.discard_time[{#BLOCKDEVICE}]',
+                'name': 'Block device {#BLOCKDEVICE}: time spent discarding',
+                'units': Plugin.UNITS.ms}]
 
         graphs = [{
             'name': 'Block device overview: {#BLOCKDEVICE}',
@@ -98,6 +186,14 @@ class DiskStats(Plugin):
                     'yaxisside': 1,
                     'color': '00CC00',
                     'key': 'system.disk.utilization[{#BLOCKDEVICE}]'}]
+        }, {
+            'name': 'Block device throughput: {#BLOCKDEVICE}',
+            'items': [{
+                    'color': 'CC0000',
+                    'key': 'system.disk.read_bytes[{#BLOCKDEVICE}]'},
+                {
+                    'color': '0000CC',
+                    'key': 'system.disk.write_bytes[{#BLOCKDEVICE}]'}]
         }]
 
         return template.discovery_rule(rule=rule, items=items, graphs=graphs)
@@ -1,10 +1,11 @@
 from mamonsu.plugins.system.plugin import SystemPlugin as Plugin
+from mamonsu.plugins.system.linux import procfs
 
 
 class La(Plugin):
 
     def run(self, zbx):
-        la_1 = open('/proc/loadavg', 'r').read().split(' ')[0]
+        la_1 = procfs.read('/proc/loadavg').split(' ')[0]
         zbx.send('system.la[1]', float(la_1))
 
     def items(self, template):
@@ -1,4 +1,5 @@
 from mamonsu.plugins.system.plugin import SystemPlugin as Plugin
+from mamonsu.plugins.system.linux import procfs
 
 
 class Memory(Plugin):
@@ -53,12 +54,11 @@ class Memory(Plugin):
 
         meminfo, result = {}, {}
 
-        with open('/proc/meminfo', 'r') as f:
-            for line in f:
-                data = line.split()
-                key, val = data[0], data[1]
-                key = key.split(':')[0]
-                meminfo[key] = float(val) * 1024
+        for line in procfs.read('/proc/meminfo').splitlines():
+            data = line.split()
+            key, val = data[0], data[1]
+            key = key.split(':')[0]
+            meminfo[key] = float(val) * 1024
 
         for item in self.Items:
             zbx_key, meminfo_key = item[0], item[1]
@@ -1,4 +1,5 @@
 from mamonsu.plugins.system.plugin import SystemPlugin as Plugin
+from mamonsu.plugins.system.linux import procfs
 
 
 class Net(Plugin):
@@ -14,19 +15,21 @@ class Net(Plugin):
     ]
 
     def run(self, zbx):
-        with open('/proc/net/dev', 'r') as f:
-            devices = []
-            for idx_line, line in enumerate(f, 1):
-                if line.find(':') < 0 or line.find(' lo:') > 0 or idx_line < 1:
-                    continue
-                face, data = line.split(':')
-                iface, values = face.strip(), [x for x in data.split()]
-                for idx, value in enumerate(values):
-                    for item in self.Items:
-                        if item[0] == idx:
-                            key = '{0}[{1}]'.format(item[1], iface)
-                            zbx.send(key, float(value), self.DELTA_SPEED)
-                devices.append({'{#NETDEVICE}': iface})
+        devices, metrics = [], []
+        lines = procfs.read('/proc/net/dev').splitlines()
+        for idx_line, line in enumerate(lines, 1):
+            if line.find(':') < 0 or line.find(' lo:') > 0 or idx_line < 1:
+                continue
+            face, data = line.split(':')
+            iface, values = face.strip(), [x for x in data.split()]
+            for idx, value in enumerate(values):
+                for item in self.Items:
+                    if item[0] == idx:
+                        key = '{0}[{1}]'.format(item[1], iface)
+                        metrics.append(
+                            (key, float(value), self.DELTA_SPEED))
+            devices.append({'{#NETDEVICE}': iface})
+        zbx.send_many(metrics)
         zbx.send('system.net.discovery[]', zbx.json({'data': devices}))
 
     def discovery_rules(self, template):
@@ -1,10 +1,11 @@
 from mamonsu.plugins.system.plugin import SystemPlugin as Plugin
+from mamonsu.plugins.system.linux import procfs
 
 
 class OpenFiles(Plugin):
 
     def run(self, zbx):
-        open_files = open('/proc/sys/fs/file-nr', 'r').read().split("\t")[0]
+        open_files = procfs.read('/proc/sys/fs/file-nr').split("\t")[0]
         zbx.send('system.open_files[]', int(open_files))
 
     def items(self, template):
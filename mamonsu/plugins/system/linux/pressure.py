@@ -0,0 +1,331 @@
+import os
+from mamonsu.plugins.system.plugin import SystemPlugin as Plugin
+from mamonsu.plugins.system.linux import procfs
+from mamonsu.plugins.pgsql.pool import Pooler
+
+
+class Pressure(Plugin):
+
+    """Pressure stall information of system and of PostgreSQL cgroup
+    (cgroup v2) with cpu, memory and io accounting of the cgroup.
+    Files are kept open by procfs, a sample is a dozen of reads."""
+
+    DEFAULT_CONFIG = {
+        # auto: cgroup of postmaster, or path from root of cgroup v2
+        # like /system.slice/postgresql.service, None: only system
+        'cgroup': 'auto'}
+
+    Resources = ['cpu', 'io', 'memory']
+    # some, full: (field, multiplier, delta), stall total is in usec
+    PressureFields = [
+        ('avg10', 1, None),
+        ('avg60', 1, None),
+        ('avg300', 1, None),
+        ('total', 0.0001, Plugin.DELTA_SPEED),
+    ]
+
+    # (field of cpu.stat, key, name, multiplier, units)
+    CpuStat = [
+        ('usage_usec', 'usage', 'cpu usage', 0.0001, Plugin.UNITS.percent),
+        ('user_usec', 'user', 'cpu usage by user', 0.0001,
+            Plugin.UNITS.percent),
+        ('system_usec', 'system', 'cpu usage by system', 0.0001,
+            Plugin.UNITS.percent),
+        ('nr_periods', 'periods', 'quota periods/s', 1, Plugin.UNITS.none),
+        ('nr_throttled', 'throttled_periods', 'throttled periods/s', 1,
+            Plugin.UNITS.none),
+        ('throttled_usec', 'throttled', 'throttled time', 0.0001,
+            Plugin.UNITS.percent),
+    ]
+    # counters of memory.events
+    MemoryEvents = ['low', 'high', 'max', 'oom', 'oom_kill']
+    # counters of io.stat, summed over devices
+    IoStat = [
+        ('rbytes', 'read bytes/s', Plugin.UNITS.bytes),
+        ('wbytes', 'write bytes/s', Plugin.UNITS.bytes),
+        ('rios', 'read operations/s', Plugin.UNITS.none),
+        ('wios', 'write operations/s', Plugin.UNITS.none),
+        ('dbytes', 'discarded bytes/s', Plugin.UNITS.bytes),
+        ('dios', 'discard operations/s', Plugin.UNITS.none),
+    ]
+
+    CgroupFiles = [
+        'cpu.stat', 'cpu.pressure', 'io.pressure', 'memory.pressure',
+        'memory.current', 'memory.max', 'memory.events', 'io.stat']
+
+    MountInfo = '/proc/self/mountinfo'
+    # absent files (not enabled controller) and not found postmaster
+    # are checked again every RecheckRuns runs
+    RecheckRuns = 60
+
+    def __init__(self, config):
+        super(Pressure, self).__init__(config)
+        self.cgroup = self.plugin_config('cgroup')
+        self._pgsql = config.fetch('postgres', 'enabled', bool)
+        # mount point of cgroup v2, False if it is not mounted
+        self._mount = None
+        # postmaster and directory of its cgroup
+        self._postmaster, self._path = None, None
+        # run after which postmaster is looked up again if not found
+        self._find_after = 0
+        # cgroup which was not available, logged once
+        self._lost = None
+        # zabbix keys of pressure lines by (prefix, resource, some/full)
+        self._keys = {}
+        self._pressure_names = [x[0] for x in self.PressureFields]
+        # (cgroup directory, {name: path of file})
+        self._files = (None, {})
+        # files which could not be read, skipped until recheck
+        self._missing, self._runs = set(), 0
+
+    def run(self, zbx):
+        self._runs += 1
+        if self._runs % self.RecheckRuns == 0:
+            self._missing.clear()
+        metrics = []
+        for resource in self.Resources:
+            metrics.extend(self._pressure(
+                '/proc/pressure/{0}'.format(resource),
+                'system.pressure', resource))
+        path = self._cgroup_path()
+        if path is not None:
+            metrics.extend(self._cgroup_metrics(path))
+        zbx.send_many(metrics)
+
+    def _cgroup_metrics(self, path):
+        result = []
+        files = self._cgroup_files(path)
+        data = self._read(files['cpu.stat'])
+        if data is None:
+            # cgroup is removed, find it again on next run
+            if path != self._lost:
+                self._lost = path
+                self.log.info('cgroup {0} is not available'.format(path))
+            for name in self.CgroupFiles:
+                procfs.close(files[name])
+                self._missing.discard(files[name])
+            self._postmaster, self._path = None, None
+            return result
+        self._lost = None
+        values = self._key_values(data)
+        for field, key, _, multiplier, _ in self.CpuStat:
+            if field in values:
+                result.append((
+                    'system.cgroup.cpu[{0}]'.format(key),
+                    values[field] * multiplier, self.DELTA_SPEED))
+        for resource in self.Resources:
+            result.extend(self._pressure(
+                files['{0}.pressure'.format(resource)],
+                'system.cgroup.pressure', resource))
+        for name in ('current', 'max'):
+            data = self._read(files['memory.{0}'.format(name)])
+            # memory.max is 'max' without limit
+            if data is not None and data.strip().isdigit():
+                result.append((
+                    'system.cgroup.memory[{0}]'.format(name),
+                    int(data)))
+        data = self._read(files['memory.events'])
+        if data is not None:
+            values = self._key_values(data)
+            for key in self.MemoryEvents:
+                if key in values:
+                    result.append((
+                        'system.cgroup.memory_events[{0}]'.format(key),
+                        values[key], self.DELTA_CHANGE))
+        data = self._read(files['io.stat'])
+        if data is not None:
+            # 8:0 rbytes=1 wbytes=2 rios=3 wios=4 dbytes=0 dios=0
+            totals = dict((x[0], 0) for x in self.IoStat)
+            for line in data.splitlines():
+                for pair in line.split()[1:]:
+                    key, _, value = pair.partition('=')
+                    if key in totals:
+                        totals[key] += int(value)
+            for key, _, _ in self.IoStat:
+                result.append((
+                    'system.cgroup.io[{0}]'.format(key),
+                    totals[key], self.DELTA_SPEED))
+        return result
+
+    # some avg10=0.00 avg60=0.00 avg300=0.00 total=0
+    # full avg10=0.00 avg60=0.00 avg300=0.00 total=0
+    def _pressure(self, path, prefix, resource):
+        result = []
+        data = self._read(path)
+        if data is None:
+            return result
+        for line in data.splitlines():
+            # some avg10 0.00 avg60 0.00 avg300 0.00 total 0
+            fields = line.replace('=', ' ').split()
+            if fields[1::2] != self._pressure_names:
+                continue
+            keys = self._keys.get((prefix, resource, fields[0]))
+            if keys is None:
+                keys = self._keys[(prefix, resource, fields[0])] = [
+                    '{0}[{1},{2},{3}]'.format(
+                        prefix, resource, fields[0], x[0])
+                    for x in self.PressureFields]
+            for key, value, field in zip(
+                    keys, fields[2::2], self.PressureFields):
+                result.append((key, float(value) * field[1], field[2]))
+        return result
+
+    # {name: path} of cgroup files
+    def _cgroup_files(self, path):
+        if self._files[0] != path:
+            self._files = (path, dict(
+                (x, os.path.join(path, x)) for x in self.CgroupFiles))
+        return self._files[1]
+
+    def _key_values(self, data):
+        result = {}
+        for line in data.splitlines():
+            fields = line.split()
+            if len(fields) == 2:
+                result[fields[0]] = int(fields[1])
+        return result
+
+    def _read(self, path):
+        if path in self._missing:
+            return None
+        # absent on old kernels, without enabled controller
+        # or with psi=0 (EOPNOTSUPP)
+        try:
+            return procfs.read(path)
+        except (IOError, OSError) as e:
+            self.log.debug('read {0}: {1}'.format(path, e))
+            self._missing.add(path)
+            return None
+
+    # directory of monitored cgroup, None if it is not known
+    def _cgroup_path(self):
+        if self.cgroup is None or self.cgroup == 'None':
+            return None
+        if self._mount is None:
+            self._mount = self._cgroup_mount()
+        if self._mount is False:
+            return None
+        if self.cgroup != 'auto':
+            return self._mount + self.cgroup.rstrip('/')
+        if self._postmaster is not None and not os.path.exists(
+                '/proc/{0}'.format(self._postmaster)):
+            self._postmaster, self._path = None, None
+        if self._postmaster is None:
+            if self._runs < self._find_after:
+                return None
+            self._postmaster = self._find_postmaster()
+            if self._postmaster is None:
+                self._find_after = self._runs + self.RecheckRuns
+                return None
+            self._path = None
+            try:
+                for line in procfs.read_once(
+                        '/proc/{0}/cgroup'.format(
+                            self._postmaster)).splitlines():
+                    # unified hierarchy: 0::/system.slice/postgresql.service
+                    if line.startswith('0::'):
+                        self._path = self._mount + line[3:].rstrip('/')
+            except (IOError, OSError) as e:
+                self.log.debug('read cgroup of postmaster: {0}'.format(e))
+            self.log.info('cgroup of postmaster {0}: {1}'.format(
+                self._postmaster, self._path))
+        return self._path
+
+    def _cgroup_mount(self):
+        with open(self.MountInfo, 'r') as f:
+            for line in f:
+                # 42 32 0:38 / /sys/fs/cgroup/unified rw - cgroup2 cgroup2 rw
+                data = line.split(' - ')
+                if len(data) == 2 and data[1].split()[0] == 'cgroup2':
+                    return data[0].split()[4]
+        self.log.info('cgroup v2 is not mounted, only system pressure')
+        return False
+
+    # parent of our backend, forked from the same executable,
+    # None if PostgreSQL is not running on this host
+    def _find_postmaster(self):
+        if not self._pgsql:
+            return None
+        try:
+            pid = int(Pooler.query(
+                'select pg_catalog.pg_backend_pid()')[0][0])
+            comm, ppid = self._comm_and_parent(pid)
+            if ppid > 1 and self._comm_and_parent(ppid)[0] == comm:
+                return ppid
+        except Exception as e:
+            self.log.debug('find postmaster: {0}'.format(e))
+        self.log.debug('postmaster is not found on this host')
+        return None
+
+    def _comm_and_parent(self, pid):
+        stat = procfs.read_once('/proc/{0}/stat'.format(pid))
+        return (
+            stat[stat.index('(') + 1:stat.rindex(')')],
+            int(stat[stat.rindex(')') + 2:].split()[1]))
+
+    def items(self, template):
+        result = ''
+        for prefix, title in [
+                ('system.pressure', 'System'),
+                ('system.cgroup.pressure', 'PostgreSQL cgroup')]:
+            for resource in self.Resources:
+                for kind in ('some', 'full'):
+                    for field, _, _ in self.PressureFields:
+                        result += template.item({
+                            'name': '{0} {1} pressure: {2} {3}'.format(
+                                title, resource, kind, field),
+                            'key': '{0}[{1},{2},{3}]'.format(
+                                prefix, resource, kind, field),
+                            'units': Plugin.UNITS.percent
+                        })
+        for _, key, name, _, units in self.CpuStat:
+            result += template.item({
+                'name': 'PostgreSQL cgroup: {0}'.format(name),
+                'key': 'system.cgroup.cpu[{0}]'.format(key),
+                'units': units
+            })
+        for name in ('current', 'max'):
+            result += template.item({
+                'name': 'PostgreSQL cgroup: memory {0}'.format(name),
+                'key': 'system.cgroup.memory[{0}]'.format(name),
+                'value_type': Plugin.VALUE_TYPE.numeric_unsigned,
+                'units': Plugin.UNITS.bytes
+            })
+        for key in self.MemoryEvents:
+            result += template.item({
+                'name': 'PostgreSQL cgroup: memory events {0}'.format(key),
+                'key': 'system.cgroup.memory_events[{0}]'.format(key)
+            })
+        for key, name, units in self.IoStat:
+            result += template.item({
+                'name': 'PostgreSQL cgroup: {0}'.format(name),
+                'key': 'system.cgroup.io[{0}]'.format(key),
+                'units': units
+            })
+        return result
+
+    def graphs(self, template):
+        colors = {'cpu': 'CC0000', 'io': '0000CC', 'memory': '00CC00'}
+        result = ''
+        for prefix, title in [
+                ('system.pressure', 'System'),
+                ('system.cgroup.pressure', 'PostgreSQL cgroup')]:
+            items = []
+            for resource in self.Resources:
+                items.append({
+                    'key': '{0}[{1},some,avg10]'.format(prefix, resource),
+                    'color': colors[resource]
+                })
+            result += template.graph({
+                'name': '{0} pressure stall'.format(title), 'items': items})
+        result += template.graph({
+            'name': 'PostgreSQL cgroup: cpu usage and throttling',
+            'items': [
+                {'key': 'system.cgroup.cpu[usage]', 'color': '00CC00'},
+                {'key': 'system.cgroup.cpu[throttled]', 'color': 'CC0000'}]})
+        result += template.graph({
+            'name': 'PostgreSQL cgroup: memory',
+            'items': [
+                {'key': 'system.cgroup.memory[current]', 'color': '0000CC'},
+                {'key': 'system.cgroup.memory[max]', 'color': 'CC0000'}]})
+        return result
@@ -1,15 +1,19 @@
-import re
+import os
 
 from mamonsu.plugins.system.plugin import SystemPlugin as Plugin
+from mamonsu.plugins.system.linux import procfs
 
 
 class ProcStat(Plugin):
 
+    DEFAULT_CONFIG = {
+        'per_cpu': str(False),
+        'per_node': str(False)}
+
     # alert fork-rate
     ForkRate = 500
-    # /proc/stat all cpu line
-    re_stat = re.compile(
-        'cpu\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)')
+
+    NodePath = '/sys/devices/system/node'
 
     ProcessItems = [
         # key, zbx_key, name, delta, color, side
@@ -21,51 +25,155 @@ class ProcStat(Plugin):
             'forkrate', Plugin.DELTA.speed_per_second, '0000CC', 1),
     ]
 
-    CpuItems = [
+    KernelItems = [
         # key, zbx_key, name, delta, color, side
-        (1, 'cpu[user]',
+        ('ctxt', 'kernel[context_switches]',
+            'context switches', Plugin.DELTA.speed_per_second, 'CC0000', 0),
+        ('intr', 'kernel[interrupts]',
+            'interrupts', Plugin.DELTA.speed_per_second, '0000CC', 0),
+        ('softirq', 'kernel[softirqs]',
+            'softirqs', Plugin.DELTA.speed_per_second, '00CC00', 0),
+    ]
+
+    CpuItems = [
+        # field of cpu line, key, name, delta, color, side
+        (1, 'user',
             'by normal programs and daemons',
             Plugin.DELTA.speed_per_second, '0000CC', 0),
-        (2, 'cpu[nice]',
+        (2, 'nice',
             'by nice(1)d programs',
             Plugin.DELTA.speed_per_second, 'CC00CC', 0),
-        (3, 'cpu[system]',
+        (3, 'system',
             'by the kernel in system activities',
             Plugin.DELTA.speed_per_second, 'CC0000', 0),
-        (5, 'cpu[iowait]',
+        (5, 'iowait',
             'waiting for I/O operations',
             Plugin.DELTA.speed_per_second, 'CCCC00', 0),
-        (6, 'cpu[irq]',
+        (6, 'irq',
             'handling interrupts',
             Plugin.DELTA.speed_per_second, '777777', 0),
-        (7, 'cpu[softirq]',
+        (7, 'softirq',
             'handling batched interrupts',
             Plugin.DELTA.speed_per_second, '000077', 0),
-        (4, 'cpu[idle]',
+        (8, 'steal',
+            'stolen by hypervisor',
+            Plugin.DELTA.speed_per_second, '770000', 0),
+        (4, 'idle',
             'Idle CPU time',
             Plugin.DELTA.speed_per_second, '00CC00', 0),
     ]
 
+    # already counted in user and nice, not stacked in graph
+    GuestItems = [
+        (9, 'guest',
+            'running guest virtual machines',
+            Plugin.DELTA.speed_per_second, '007777', 0),
+        (10, 'guest_nice',
+            'running niced guest virtual machines',
+            Plugin.DELTA.speed_per_second, '770077', 0),
+    ]
+
+    def __init__(self, config):
+        super(ProcStat, self).__init__(config)
+        self.per_cpu = self.plugin_config('per_cpu') == 'True'
+        self.per_node = self.plugin_config('per_node') == 'True'
+        # cpus of the last read and numa node of each of them
+        self._cpus, self._nodes = None, {}
+
     def run(self, zbx):
-        with open('/proc/stat', 'r') as f:
-            for line in f:
-                data = line.split()
-                # parse processes
-                for item in self.ProcessItems:
-                    if data[0] == item[0]:
-                        value = int(data[1])
-                        zbx.send(
-                            'system.{0}'.format(item[1]), value, item[3])
-                        break
-                # parse cpu
+        metrics, cpus, values = [], [], []
+        # one pass: cpu lines are collected as rows of numbers,
+        # other lines are matched by the first word
+        for line in procfs.read('/proc/stat').splitlines():
+            data = line.split()
+            if len(data) < 2:
+                continue
+            if data[0].startswith('cpu'):
                 if data[0] == 'cpu':
-                    m = self.re_stat.match(line)
-                    if m is None:
-                        continue
-                    for item in self.CpuItems:
-                        value = m.group(item[0])
-                        zbx.send(
-                            'system.{0}'.format(item[1]), int(value), item[3])
+                    metrics.extend(self._cpu_metrics(
+                        'system.cpu[{0}]', None, data))
+                elif self.per_cpu or self.per_node:
+                    cpus.append(data[0][3:])
+                    values.append(data)
+                continue
+            for item in self.ProcessItems + self.KernelItems:
+                if data[0] == item[0]:
+                    # intr and softirq: the total is the first number
+                    metrics.append((
+                        'system.{0}'.format(item[1]), int(data[1]), item[3]))
+                    break
+
+        if self.per_cpu:
+            for cpu, data in zip(cpus, values):
+                metrics.extend(self._cpu_metrics(
+                    'system.cpu.{0}[{1}]', cpu, data))
+        if self.per_node:
+            if cpus != self._cpus:
+                self._cpus = cpus
+                self._nodes = self._read_nodes()
+            # sum of columns of node cpus
+            nodes = {}
+            for cpu, data in zip(cpus, values):
+                node = self._nodes.get(cpu)
+                if node is None:
+                    continue
+                row = [int(x) for x in data[1:]]
+                total = nodes.get(node)
+                if total is None:
+                    nodes[node] = row
+                else:
+                    nodes[node] = [x + y for x, y in zip(total, row)]
+            for node in sorted(nodes, key=int):
+                metrics.extend(self._cpu_metrics(
+                    'system.cpu.node.{0}[{1}]', node,
+                    ['node'] + nodes[node]))
+
+        zbx.send_many(metrics)
+        if self.per_cpu:
+            zbx.send('system.cpu.discovery[]', zbx.json({
+                'data': [{'{#CPU}': x} for x in cpus]}))
+        if self.per_node:
+            zbx.send('system.cpu.node.discovery[]', zbx.json({
+                'data': [{'{#NODE}': x} for x in sorted(
+                    set(self._nodes.values()), key=int)]}))
+
+    def _cpu_metrics(self, key, cpu, data):
+        result = []
+        for item in self.CpuItems + self.GuestItems:
+            # steal and guest are absent on old kernels
+            if item[0] >= len(data):
+                continue
+            if cpu is None:
+                zbx_key = key.format(item[1])
+            else:
+                zbx_key = key.format(item[1], cpu)
+            result.append((zbx_key, int(data[item[0]]), item[3]))
+        return result
+
+    # {cpu number: node number} from sysfs, empty without numa
+    def _read_nodes(self):
+        result = {}
+        if not os.path.isdir(self.NodePath):
+            return result
+        for name in os.listdir(self.NodePath):
+            if not name.startswith('node') or not name[4:].isdigit():
+                continue
+            path = os.path.join(self.NodePath, name, 'cpulist')
+            try:
+                with open(path, 'r') as f:
+                    cpulist = f.read().strip()
+            except (IOError, OSError) as e:
+                self.log.debug('read {0}: {1}'.format(path, e))
+                continue
+            # 0-3,8-11
+            for part in cpulist.split(','):
+                if part == '':
+                    continue
+                bounds = part.split('-')
+                for cpu in range(int(bounds[0]), int(bounds[-1]) + 1):
+                    result[str(cpu)] = name[4:]
+        self.log.debug('numa nodes of cpus: {0}'.format(result))
+        return result
 
     def items(self, template):
         result = ''
@@ -74,11 +182,16 @@ class ProcStat(Plugin):
                 'name': 'Processes: {0}'.format(item[2]),
                 'key': 'system.{0}'.format(item[1])
             })
-        for item in self.CpuItems:
+        for item in self.KernelItems:
             result += template.item({
-                'name': 'CPU time spent {0}'.format(item[2]),
+                'name': 'Kernel: {0}'.format(item[2]),
                 'key': 'system.{0}'.format(item[1])
             })
+        for item in self.CpuItems + self.GuestItems:
+            result += template.item({
+                'name': 'CPU time spent {0}'.format(item[2]),
+                'key': 'system.cpu[{0}]'.format(item[1])
+            })
         return result
 
     def graphs(self, template):
@@ -91,12 +204,20 @@ class ProcStat(Plugin):
             })
         graphs = template.graph({'name': 'Processes overview', 'items': items})
         items = []
-        for item in self.CpuItems:
+        for item in self.KernelItems:
             items.append({
                 'key': 'system.{0}'.format(item[1]),
                 'color': item[4],
                 'yaxisside': item[5]
             })
+        graphs += template.graph({'name': 'Kernel activity', 'items': items})
+        items = []
+        for item in self.CpuItems:
+            items.append({
+                'key': 'system.cpu[{0}]'.format(item[1]),
+                'color': item[4],
+                'yaxisside': item[5]
+            })
         graphs += template.graph({
             'name': 'CPU time spent',
             'items': items, 'type': self.GRAPH_TYPE.stacked})
@@ -109,3 +230,32 @@ class ProcStat(Plugin):
             'expression': '{#TEMPLATE:system.processes[forkrate]'
             '.last()}&gt;' + str(self.ForkRate)
         })
+
+    def discovery_rules(self, template):
+        return self._discovery_rule(
+            template, 'CPU', 'system.cpu.{0}[{{#CPU}}]',
+            'system.cpu.discovery[]', '{#CPU}') + self._discovery_rule(
+            template, 'NUMA node', 'system.cpu.node.{0}[{{#NODE}}]',
+            'system.cpu.node.discovery[]', '{#NODE}')
+
+    def _discovery_rule(self, template, name, key, discovery, macro):
+        rule = {
+            'name': '{0} discovery'.format(name),
+            'key': discovery,
+            'filter': '{0}:.*'.format(macro)
+        }
+        items, graph_items = [], []
+        for item in self.CpuItems + self.GuestItems:
+            items.append({
+                'key': key.format(item[1]),
+                'name': '{0} {1}: time spent {2}'.format(
+                    name, macro, item[2])})
+        for item in self.CpuItems:
+            graph_items.append({
+                'key': key.format(item[1]),
+                'color': item[4]})
+        graphs = [{
+            'name': '{0} time spent: {1}'.format(name, macro),
+            'type': self.GRAPH_TYPE.stacked,
+            'items': graph_items}]
+        return template.discovery_rule(rule=rule, items=items, graphs=graphs)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import os
+import errno
+import threading
+
+# errors of kept descriptor, after which the file is opened again
+_Stale = (errno.ENOENT, errno.ENODEV, errno.ESTALE, errno.EBADF)
+
+
+class ProcFile(object):
+
+    """Pseudo-file of /proc or /sys kept open between reads.
+    Content is read from offset 0 (pread, or lseek and read on
+    python 2) into a buffer which grows to the file size and is
+    reused, so a read costs one syscall and no open/close."""
+
+    BufferSize = 16 * 1024
+
+    def __init__(self, path, size=None):
+        self.path = path
+        self.fd = None
+        self.lock = threading.Lock()
+        self.buffer = bytearray(size or self.BufferSize)
+
+    def read(self):
+        with self.lock:
+            try:
+                return self._read()
+            except OSError as e:
+                # removed and created again (device, cgroup),
+                # the last try with a new descriptor
+                if e.errno not in _Stale:
+                    raise
+                self._close()
+                return self._read()
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+    def _read(self):
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_RDONLY)
+        while True:
+            size = self._read_at_start()
+            if size < len(self.buffer):
+                return self.buffer[:size].decode('utf-8')
+            # file could be bigger than buffer
+            self.buffer = bytearray(len(self.buffer) * 2)
+
+    if hasattr(os, 'preadv'):
+        def _read_at_start(self):
+            return os.preadv(self.fd, [self.buffer], 0)
+    else:
+        def _read_at_start(self):
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            size = 0
+            while size < len(self.buffer):
+                data = os.read(self.fd, len(self.buffer) - size)
+                if len(data) == 0:
+                    break
+                self.buffer[size:size + len(data)] = data
+                size += len(data)
+            return size
+
+    def _close(self):
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+            self.fd = None
+
+
+_files = {}
+_files_lock = threading.Lock()
+
+
+def read(path):
+    """Content of pseudo-file by shared ProcFile."""
+    with _files_lock:
+        proc_file = _files.get(path)
+        if proc_file is None:
+            proc_file = _files[path] = ProcFile(path)
+    return proc_file.read()
+
+
+def close(path):
+    """Close shared ProcFile of removed file (e.g. of cgroup)."""
+    with _files_lock:
+        proc_file = _files.pop(path, None)
+    if proc_file is not None:
+        proc_file.close()
+
+
+def read_once(path, size=4096):
+    """Content of pseudo-file opened only for this read, for files of
+    short-lived processes (/proc/<pid>/...) which are not worth to keep
+    a descriptor: open, read and close without python file object."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        chunks = []
+        while True:
+            data = os.read(fd, size)
+            if len(data) == 0:
+                break
+            chunks.append(data)
+    finally:
+        os.close(fd)
+    return b''.join(chunks).decode('utf-8')
@@ -1,4 +1,5 @@
 from mamonsu.plugins.system.plugin import SystemPlugin as Plugin
+from mamonsu.plugins.system.linux import procfs
 
 
 class SystemUptime(Plugin):
@@ -6,7 +7,7 @@ class SystemUptime(Plugin):
     DEFAULT_CONFIG = {'uptime': str(60 * 5)}
 
     def run(self, zbx):
-        uptime = open('/proc/uptime', 'r').read().split(' ')[0]
+        uptime = procfs.read('/proc/uptime').split(' ')[0]
         zbx.send('system.uptime[]', int(float(uptime)))
 
     def items(self, template):
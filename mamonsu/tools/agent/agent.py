@@ -2,6 +2,7 @@
 from mamonsu.lib.plugin import Plugin
 
 from mamonsu.lib.const import API
+from mamonsu.plugins.pgsql.driver._stats import QueryStats
 import mamonsu.lib.platform as platform
 
 if platform.PY3:
@@ -16,6 +17,8 @@ else:
 
 class AgentApi(Plugin):
 
+    _detached = True
+
     def __init__(self, config):
         super(AgentApi, self).__init__(config)
         self._enabled = config.fetch('agent', 'enabled', bool)
@@ -80,6 +83,20 @@ class AgentApiHandler(BaseHTTPRequestHandler):
             if platform.PY3:
                 result = bytearray(result, 'utf-8')
             self.wfile.write(result)
+        # stats of queries to PostgreSQL by fingerprint
+        elif req.path in API.QUERY_STATS_URLS:
+            result = 'instance\tdatabase\tquery\tcalls\terrors\trows' \
+                '\tbytes\ttime\tmax_time\tfingerprint\n'
+            for name, stats in QueryStats.registry:
+                for ident, db, val in stats.take_stats(reset=False):
+                    result += '{0}\t{1}\t{2}\t{3}\t{4}\t{5}\t{6}\t' \
+                        '{7:.3f}\t{8:.3f}\t{9}\n'.format(
+                            name, db, ident, val['calls'], val['errors'],
+                            val['rows'], val['bytes'], val['time'],
+                            val['max_time'], val['query'])
+            if platform.PY3:
+                result = bytearray(result, 'utf-8')
+            self.wfile.write(result)
         else:
             # unknown path
             self.wfile.write(API.UNKNOWN_VERSION)
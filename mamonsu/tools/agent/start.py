@@ -26,6 +26,7 @@ Examples:
     {prog} agent version
     {prog} agent metric-list
     {prog} agent metric-get <metric key>
+    {prog} agent queries
 """.format(prog=sys.argv[0])
 
     parser = optparse.OptionParser(
@@ -51,6 +52,10 @@ Examples:
         if len(commands) >= 2:
             return print_help()
         url = 'http://{0}:{1}/list'.format(host, port)
+    elif commands[0] == 'queries':
+        if len(commands) >= 2:
+            return print_help()
+        url = 'http://{0}:{1}/queries'.format(host, port)
     elif commands[0] == 'metric-get':
         if not len(commands) == 2:
             return print_help()
@@ -1,7 +1,24 @@
+import sys
 import codecs
 import mamonsu
 from os import path
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
+
+# modules with async def, imported only if mamonsu.lib.platform.ASYNC
+ASYNC_MODULES = [
+    ('mamonsu.lib', 'aio'),
+    ('mamonsu.plugins.pgsql.driver', 'aio')]
+
+
+class BuildPy(build_py):
+
+    # do not install (and byte-compile) async modules for python < 3.5
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info >= (3, 5):
+            return modules
+        return [x for x in modules if (x[0], x[1]) not in ASYNC_MODULES]
 
 
 def long_description():
@@ -26,5 +43,6 @@ setup(
             'mamonsu=mamonsu.lib.runner:start'
         ],
     },
+    cmdclass={'build_py': BuildPy},
     zip_safe=True,
 )
@@ -43,6 +43,11 @@ setup(
                 'mamonsu.tools.tune',
                 'mamonsu.tools.zabbix_cli',
             ],
+            # async def is a syntax error for python 2
+            'excludes': [
+                'mamonsu.lib.aio',
+                'mamonsu.plugins.pgsql.driver.aio',
+            ],
             'bundle_files': 1,
             'dist_dir': 'dist',
             'xref': False,
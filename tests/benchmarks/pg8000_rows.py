@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+# Decoding of DataRow messages by pg8000 against the former column by
+# column loop with oid and xid in text format: rows of fixed-width
+# columns are decoded with precompiled row layout, rows with text
+# columns (like per-relation CFS ratios) are still decoded by columns.
+# Handler is chosen per statement as Connection.handle_messages does.
+#
+# usage: python tests/benchmarks/pg8000_rows.py
+
+import gc
+import os
+import sys
+import time
+from struct import pack
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from mamonsu.plugins.pgsql.driver.pg8000 import core  # noqa
+
+SIZES = [10000, 100000, 500000]
+REPEAT = 10
+
+
+def text_recv(data, offset, length):
+    return data[offset:offset + length].decode('utf-8')
+
+
+def column(value, fmt):
+    if value is None:
+        return pack('!i', -1)
+    if fmt is None:
+        data = str(value).encode('utf-8')
+    else:
+        data = pack('!' + fmt, value)
+    return pack('!i', len(data)) + data
+
+
+def message(row, fmts):
+    return pack('!h', len(row)) + b''.join(
+        column(value, fmt) for value, fmt in zip(row, fmts))
+
+
+# (name, row, former (funcs, formats), current (funcs, formats)),
+# format None is text
+def cases():
+    return [
+        # relid, relfrozenxid, seq_scan, idx_scan, n_live_tup, dead ratio
+        ('stats',
+         [16384, 123456, 42, 1000000, 500000, 0.25],
+         ([core.int_in, core.int_in, core.int8_recv, core.int8_recv,
+           core.int8_recv, core.float8_recv],
+          [None, None, 'q', 'q', 'q', 'd']),
+         ([core.uint4_recv, core.uint4_recv, core.int8_recv,
+           core.int8_recv, core.int8_recv, core.float8_recv],
+          ['I', 'I', 'q', 'q', 'q', 'd'])),
+        ('stats with null',
+         [16384, 123456, None, 1000000, 500000, 0.25],
+         ([core.int_in, core.int_in, core.int8_recv, core.int8_recv,
+           core.int8_recv, core.float8_recv],
+          [None, None, 'q', 'q', 'q', 'd']),
+         ([core.uint4_recv, core.uint4_recv, core.int8_recv,
+           core.int8_recv, core.int8_recv, core.float8_recv],
+          ['I', 'I', 'q', 'q', 'q', 'd'])),
+        ('cfs ratio',
+         ['db_01.public.relation_12345', 2.75],
+         ([text_recv, core.float8_recv], [None, 'd']),
+         ([text_recv, core.float8_recv], [None, 'd'])),
+    ]
+
+
+def prepared(funcs, fmts):
+    # layout as row_struct() builds it from RowDescription
+    fixed = dict((code, oid) for oid, code in core.FIXED_WIDTH.items())
+    row_desc, pg_types = [], {}
+    for fmt in fmts:
+        oid = fixed.get(fmt, 25)
+        row_desc.append({'type_oid': oid})
+        pg_types[oid] = (core.FC_TEXT if fmt is None else core.FC_BINARY, None)
+    return {
+        'input_funcs': tuple(funcs),
+        'row_struct': core.row_struct(row_desc, pg_types)}
+
+
+class Cursor(object):
+
+    def __init__(self, ps):
+        self.ps = ps
+        self._cached_rows = []
+
+
+def per_column(self, data, cursor):
+    # DataRow handler before row layouts
+    data_idx = 2
+    row = []
+    for func in cursor.ps['input_funcs']:
+        vlen = core.i_unpack(data, data_idx)[0]
+        data_idx += 4
+        if vlen == -1:
+            row.append(None)
+        else:
+            row.append(func(data, data_idx, vlen))
+            data_idx += vlen
+    cursor._cached_rows.append(row)
+
+
+class Former(core.Connection):
+
+    handle_DATA_ROW = per_column
+
+
+def measure(handler, ps, data, count):
+    cursor = Cursor(ps)
+    gc.disable()
+    start = time.time()
+    for _ in range(count):
+        handler(data, cursor)
+    spent = time.time() - start
+    gc.enable()
+    return spent
+
+
+def main():
+    # handlers without connection: they use only the cursor,
+    # both are methods as in Connection.message_types
+    former_conn = Former.__new__(Former)
+    conn = core.Connection.__new__(core.Connection)
+    print('{0:>8} {1:>16} {2:>14} {3:>14} {4:>8}'.format(
+        'rows', 'case', 'former, ms', 'current, ms', 'speedup'))
+    for count in SIZES:
+        for name, row, former, current in cases():
+            # the best of interleaved runs, which go first in turn:
+            # a run after another one of big count is slower
+            ps = prepared(*current)
+            handler = conn.handle_DATA_ROW
+            if ps['row_struct'] is not None:
+                handler = conn.handle_DATA_ROW_struct
+            runs = [
+                (former_conn.handle_DATA_ROW, prepared(*former),
+                    message(row, former[1]), []),
+                (handler, ps, message(row, current[1]), [])]
+            for idx in range(REPEAT):
+                for handler, ps, data, spent in \
+                        runs[idx % 2:] + runs[:idx % 2]:
+                    spent.append(measure(handler, ps, data, count))
+            before, after = min(runs[0][3]), min(runs[1][3])
+            print('{0:>8} {1:>16} {2:>14.1f} {3:>14.1f} {4:>8.2f}'.format(
+                count, name, before * 1000, after * 1000, before / after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+# BackendProcesses: time of a scan of N child processes with files of
+# /proc/<pid> kept open between scans against open/read/close of each
+# file on every scan (read_once).
+#
+# usage: python tests/benchmarks/processes.py  (linux only)
+
+import os
+import sys
+import time
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from mamonsu.lib.config import Config  # noqa
+from mamonsu.plugins.pgsql.processes import BackendProcesses  # noqa
+from mamonsu.plugins.system.linux import procfs  # noqa
+
+SIZES = [100, 1000, 2000]
+RUNS = 20
+
+
+class Pool(object):
+
+    # pg_stat_activity: children of this process, the first is our backend
+    def __init__(self, pids):
+        self.rows = [[pid, 'client backend', False] for pid in pids]
+        self.rows[0][2] = True
+
+    def server_version_less(self, version):
+        return False
+
+    def query(self, query):
+        return self.rows
+
+
+class Sender(object):
+
+    def send_many(self, metrics):
+        pass
+
+
+class ReadOnce(BackendProcesses):
+
+    # files are opened for each read, as before
+    def _read_file(self, pid, name):
+        return procfs.read_once('/proc/{0}/{1}'.format(pid, name))
+
+
+def measure(klass, pool):
+    plugin = klass(Config())
+    plugin.pool = pool
+    # the first scan opens files
+    plugin.run(Sender())
+    start = time.time()
+    for _ in range(RUNS):
+        plugin.run(Sender())
+    result = (time.time() - start) / RUNS
+    for pid in list(plugin._files):
+        plugin._close(pid)
+    return result
+
+
+def main():
+    # the same executable as this process for postmaster check
+    own = subprocess.Popen(
+        [sys.executable, '-c', 'import time; time.sleep(600)'])
+    print('{0:>10} {1:>14} {2:>14} {3:>8}'.format(
+        'processes', 'read_once, ms', 'kept open, ms', 'speedup'))
+    for size in SIZES:
+        children = [
+            subprocess.Popen(['sleep', '600']) for _ in range(size - 1)]
+        try:
+            pool = Pool([own.pid] + [x.pid for x in children])
+            once = measure(ReadOnce, pool)
+            kept = measure(BackendProcesses, pool)
+            print('{0:>10} {1:>14.1f} {2:>14.1f} {3:>7.2f}x'.format(
+                size, once * 1000, kept * 1000, once / kept))
+        finally:
+            for child in children:
+                child.kill()
+                child.wait()
+    own.kill()
+    own.wait()
+
+
+if __name__ == '__main__':
+    main()
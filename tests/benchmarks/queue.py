@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+# Sender queue: add (with overflow) and flush time of the ring buffer
+# Queue against the former list based one, which inserted at the head.
+#
+# usage: python tests/benchmarks/queue.py
+
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from mamonsu.lib.queue import Queue  # noqa
+
+SIZES = [10000, 100000, 1000000]
+# the list queue is quadratic, do not wait for it on big sizes
+LIST_MAX = 100000
+
+
+class ListQueue(object):
+
+    # queue before ring buffer: newest metric first, replace() on overflow
+    def __init__(self, limit):
+        self.queue = []
+        self.limit = limit
+        self.lock = threading.Lock()
+
+    def add(self, metric):
+        self.lock.acquire()
+        if len(self.queue) > self.limit:
+            self.queue.pop()
+            self.queue.append(metric)
+        else:
+            self.queue.insert(0, metric)
+        self.lock.release()
+
+    def flush(self):
+        self.lock.acquire()
+        result, self.queue = self.queue, []
+        self.lock.release()
+        return result
+
+
+def measure(queue, count):
+    metric = {'host': 'localhost', 'key': 'key', 'value': '1', 'clock': 0}
+    start = time.time()
+    for _ in range(count):
+        queue.add(metric)
+    added = time.time()
+    queue.flush()
+    return added - start, time.time() - added
+
+
+def main():
+    print('{0:>8} {1:>14} {2:>10} {3:>10} {4:>10}'.format(
+        'metrics', 'queue', 'limit', 'add, ms', 'flush, ms'))
+    for count in SIZES:
+        # limit as count: no overflow, half of count: overflow on each add
+        for limit in (count, count // 2):
+            queues = [
+                ('drop-oldest', Queue(limit, 'drop-oldest')),
+                ('drop-newest', Queue(limit, 'drop-newest')),
+                ('sample', Queue(limit, 'sample'))]
+            if count <= LIST_MAX:
+                queues.insert(0, ('list', ListQueue(limit)))
+            for name, queue in queues:
+                add, flush = measure(queue, count)
+                print('{0:>8} {1:>14} {2:>10} {3:>10.1f} {4:>10.1f}'.format(
+                    count, name, limit, add * 1000, flush * 1000))
+
+
+if __name__ == '__main__':
+    main()
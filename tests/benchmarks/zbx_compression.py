@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+# Size and latency of zabbix sender packets with and without compression.
+# Payloads are discovery-like: many per-relation / per-database metrics.
+# Transfer time is estimated for the given link bandwidth.
+#
+# usage: python tests/benchmarks/zbx_compression.py
+
+import os
+import sys
+import time
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from mamonsu.lib.senders.zbx import ZbxSender  # noqa
+
+SIZES = [100, 1000, 10000, 50000]
+LINKS = [('1Mbit', 1e6 / 8), ('10Mbit', 10e6 / 8), ('100Mbit', 100e6 / 8)]
+REPEAT = 5
+
+
+class Sender(ZbxSender):
+
+    # skip plugin configuration
+    def __init__(self, compression):
+        self.compression = compression
+
+
+def payload(count):
+    metrics = []
+    for idx in range(count):
+        metrics.append({
+            'host': 'db-host-01.example.com',
+            'key': 'pgsql.cfs.compress_ratio[db_{0}.public.relation_{1}]'.format(
+                idx % 20, idx),
+            'value': str(1.0 + (idx % 997) / 1000.0),
+            'clock': int(time.time())})
+    return json.dumps({
+        'request': 'sender data',
+        'data': metrics,
+        'clock': int(time.time())})
+
+
+def build(sender, data):
+    start = time.time()
+    for _ in range(REPEAT):
+        packet = sender._packet(data)
+    return packet, (time.time() - start) / REPEAT
+
+
+def main():
+    plain, compressed = Sender(False), Sender(True)
+    header = '{0:>8} {1:>12} {2:>12} {3:>7} {4:>10}'.format(
+        'metrics', 'plain, b', 'zlib, b', 'ratio', 'zlib, ms')
+    for name, _ in LINKS:
+        header += ' {0:>16}'.format('saved@' + name + ', ms')
+    print(header)
+    for count in SIZES:
+        data = payload(count)
+        plain_packet, _ = build(plain, data)
+        zlib_packet, zlib_time = build(compressed, data)
+        row = '{0:>8} {1:>12} {2:>12} {3:>7.1f} {4:>10.2f}'.format(
+            count, len(plain_packet), len(zlib_packet),
+            float(len(plain_packet)) / len(zlib_packet), zlib_time * 1000)
+        for _, bandwidth in LINKS:
+            saved = (len(plain_packet) - len(zlib_packet)) / bandwidth
+            row += ' {0:>16.1f}'.format((saved - zlib_time) * 1000)
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
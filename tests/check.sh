@@ -116,6 +116,13 @@ mamonsu zabbix host create $ZABBIX_CLIENT_HOST $hostgroup_id $template_id 127.0.
 
 su postgres -c 'createdb mamonsu'
 su postgres -c 'createuser mamonsu'
+# second cluster on port 5433 for [postgres:replica] with host from
+# [postgres], it must not be resolved to socket of port 5432
+su postgres -c '/usr/pgsql-9.5/bin/initdb -D /var/lib/pgsql/9.5/replica'
+su postgres -c '/usr/pgsql-9.5/bin/pg_ctl start -w -D /var/lib/pgsql/9.5/replica -o "-p 5433"'
+su postgres -c 'createdb -p 5433 mamonsu'
+su postgres -c 'createdb -p 5433 only_on_replica'
+su postgres -c 'createuser -p 5433 mamonsu'
 # start mamonsu and sleep
 cat <<EOF > /etc/mamonsu/agent.conf
 [postgres]
@@ -123,6 +130,9 @@ host = auto
 user = mamonsu
 database = mamonsu
 
+[postgres:replica]
+port = 5433
+
 [zabbix]
 enabled = True
 address = 127.0.0.1
@@ -142,6 +152,7 @@ file = /var/log/mamonsu/agent.log
 level = DEBUG
 EOF
 mamonsu bootstrap -U postgres mamonsu
+mamonsu bootstrap -U postgres --port 5433 mamonsu
 /etc/init.d/mamonsu start
 sleep 125
 
@@ -157,6 +168,10 @@ mamonsu agent -c /etc/mamonsu/agent.conf metric-list | grep system
 grep utilization /tmp/localhost.log || exit 5
 grep 'pgsql\.uptime' /tmp/localhost.log || exit 5
 
+# instances on different ports are not mixed up
+grep only_on_replica /tmp/replica.log || exit 9
+grep only_on_replica /tmp/localhost.log && exit 9
+
 # error in zabbix server
 (mamonsu zabbix item error $ZABBIX_CLIENT_HOST | grep ZBX_NOTSUPPORTED) && exit 6
 